@@ -1,30 +1,43 @@
-import bleach
+import os
+
 from flask import Flask
-from flask_migrate import Migrate
-from markdown import markdown
 from sqlalchemy.exc import SQLAlchemyError
 
-from .models import db
-from .auth import bp as auth_bp, init_login_manager
-from .animals import bp as animals_bp
-from .routes import bp as main_bp
-
 def handle_sqlalchemy_error(err):
     error_msg = ('Возникла ошибка при подключении к базе данных. '
                  'Повторите попытку позже.')
     return f'{error_msg} (Подробнее: {err})', 500
 
 def create_app(test_config=None):
+    # Blueprints, репозитории и расширения импортируются здесь, а не при
+    # импорте пакета: `from app.models import db` в командах и скриптах не
+    # тянет за собой всё приложение
+    from .models import db
+    from .auth import bp as auth_bp, init_login_manager
+    from .animals import bp as animals_bp
+    from .routes import bp as main_bp
+    from .rendering import render_markdown_cached
+    from .commands import init_commands
+    from .tasks import init_tasks
+    from .passwords import init_passwords
+    from .instrumentation import init_instrumentation
+    from .replicas import init_replicas
+
     app = Flask(__name__, instance_relative_config=False)
     app.config.from_pyfile("config.py")
-    
+
     if test_config:
         app.config.from_mapping(test_config)
 
+    init_replicas(app)
     db.init_app(app)
-    migrate = Migrate(app, db)
+    init_migrations(app, db)
 
     init_login_manager(app)
+    init_commands(app)
+    init_tasks(app)
+    init_passwords(app)
+    init_instrumentation(app)
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(animals_bp)
@@ -33,22 +46,27 @@ def create_app(test_config=None):
 
     @app.template_filter('markdown')
     def markdown_filter(text):
-        allowed_tags = [
-            'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-            'b', 'i', 'strong', 'em', 'tt',
-            'p', 'br', 'span', 'div', 'blockquote', 'code', 'hr',
-            'ul', 'ol', 'li', 'dd', 'dt', 'dl',
-            'img', 'a', 'sub', 'sup'
-        ]
-        allowed_attributes = {
-            'a': ['href', 'title'],
-            'img': ['src', 'alt', 'title']
-        }
-        
-        html = markdown(text)
-        cleaned = bleach.clean(html, tags=allowed_tags, attributes=allowed_attributes)
-        return cleaned
+        return render_markdown_cached(text)
 
     return app
 
-app = create_app()
\ No newline at end of file
+def init_migrations(app, db):
+    """
+    Подключить Flask-Migrate (команды `flask db`). Импорт alembic заметно
+    замедляет запуск, поэтому веб-воркерам он не нужен: по умолчанию
+    миграции подключаются только при запуске через CLI flask
+    """
+    enabled = app.config.get('MIGRATIONS_ENABLED')
+    if enabled is None:
+        enabled = os.environ.get('FLASK_RUN_FROM_CLI') == 'true'
+    if enabled:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+def __getattr__(name):
+    # Приложение по умолчанию (`flask run`, gunicorn app:app) создаётся при
+    # первом обращении к app.app, а не при импорте пакета
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
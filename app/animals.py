@@ -1,18 +1,23 @@
-from flask import Blueprint, render_template, flash, redirect, url_for, request, current_app, abort
+from flask import Blueprint, render_template, flash, redirect, url_for, request, current_app, abort, jsonify
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 import os
 from datetime import datetime
 import hashlib
 import uuid
-import bleach
-from markdown import markdown
+from functools import partial
 
 from .models import Animal, Image, Adoption, AnimalStatus, AdoptionStatus, db
 from .repositories.animal_repository import AnimalRepository
 from .repositories.image_repository import ImageRepository
-from .repositories.adoption_repository import AdoptionRepository
+from .repositories.adoption_repository import (
+    AdoptionRepository, AnimalNotAvailable, AnimalNotFound, DuplicateAdoption
+)
 from .auth import check_rights
+from .tasks import enqueue_image_processing
+from .routes import render_catalog
+from .search import AGE_RANGES
+from .unit_of_work import on_commit
 
 bp = Blueprint('animals', __name__, url_prefix='/animals')
 
@@ -24,28 +29,40 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif'}
 
-def clean_markdown(content):
-    allowed_tags = [
-        'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-        'b', 'i', 'strong', 'em', 'tt',
-        'p', 'br', 'span', 'div', 'blockquote', 'code', 'hr',
-        'ul', 'ol', 'li', 'dd', 'dt', 'dl',
-        'img', 'a', 'sub', 'sup'
-    ]
-    allowed_attributes = {
-        'a': ['href', 'title'],
-        'img': ['src', 'alt', 'title']
-    }
-    
-    html = markdown(content)
-    cleaned = bleach.clean(html, tags=allowed_tags, attributes=allowed_attributes)
-    return cleaned
-
 @bp.route('/')
 def index():
+    return render_catalog()
+
+@bp.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    gender = request.args.get('gender') or None
+    age = request.args.get('age') or None
+    try:
+        status = AnimalStatus(request.args['status']) if request.args.get('status') else None
+    except ValueError:
+        abort(400)
+    if age is not None and age not in {key for key, *_ in AGE_RANGES}:
+        abort(400)
+
     page = request.args.get('page', 1, type=int)
-    animals_page = animal_repo.get_paginated_animals_sorted(page=page)
-    return render_template('main/index.html', animals_page=animals_page)
+    filters = {'query': query, 'gender': gender, 'status': status, 'age': age}
+    animals_page = animal_repo.search_animals(
+        page=page,
+        per_page=current_app.config.get('ANIMALS_PER_PAGE', 10),
+        **filters
+    )
+    facets = animal_repo.search_facets(**filters)
+
+    # Параметры поиска сохраняются в ссылках на другие страницы
+    page_args = {key: value for key, value in request.args.items() if key != 'page'}
+    return render_template('animals/search.html',
+                         animals_page=animals_page,
+                         facets=facets,
+                         query=query,
+                         selected={'gender': gender, 'status': status and status.value, 'age': age},
+                         page_args=page_args,
+                         AGE_RANGES=AGE_RANGES)
 
 @bp.route('/<int:animal_id>')
 def show(animal_id):
@@ -58,9 +75,16 @@ def show(animal_id):
     if current_user.is_authenticated:
         user_adoption = adoption_repo.get_user_adoption(current_user.id, animal_id)
     
-    adoptions = []
+    adoptions = None
     if current_user.is_authenticated and (current_user.is_admin or current_user.is_moderator):
-        adoptions = adoption_repo.get_animal_adoptions(animal_id)
+        try:
+            adoptions = adoption_repo.get_animal_adoptions_page(
+                animal_id,
+                cursor=request.args.get('adoptions_after'),
+                per_page=current_app.config.get('ADOPTIONS_PER_PAGE', 20)
+            )
+        except ValueError:
+            abort(400)
     
     return render_template('animals/show.html', 
                          animal=animal,
@@ -75,11 +99,9 @@ def show(animal_id):
 def create():
     if request.method == 'POST':
         try:
-            description = clean_markdown(request.form['description'])
-            
             animal = animal_repo.create_animal(
                 name=request.form['name'],
-                description=description,
+                description=request.form['description'],
                 age_months=int(request.form['age_months']),
                 breed=request.form['breed'],
                 gender=request.form['gender'],
@@ -92,7 +114,9 @@ def create():
                 for file in request.files.getlist('images'):
                     if file and file.filename and allowed_file(file.filename):
                         try:
-                            image_repo.add_image(file, animal.id)
+                            image = image_repo.add_image(file, animal.id)
+                            # Фоновый воркер должен увидеть уже сохранённую запись
+                            on_commit(db.session, partial(enqueue_image_processing, image.id))
                         except ValueError as e:
                             current_app.logger.error(f"Validation error: {e}")
                             flash(f'Ошибка при загрузке изображения: {e}', 'danger')
@@ -100,10 +124,12 @@ def create():
                             current_app.logger.error(f"Error saving image: {e}")
                             flash('Ошибка при сохранении изображения', 'danger')
             
+            db.session.commit()
             flash('Животное успешно добавлено', 'success')
             return redirect(url_for('animals.show', animal_id=animal.id))
             
         except Exception as e:
+            db.session.rollback()
             current_app.logger.error(f"Error creating animal: {e}")
             flash('При сохранении данных возникла ошибка. Проверьте корректность введённых данных.', 'danger')
     
@@ -123,16 +149,18 @@ def edit(animal_id):
             animal_repo.update_animal(
                 animal,
                 name=request.form['name'],
-                description=clean_markdown(request.form['description']),
+                description=request.form['description'],
                 age_months=int(request.form['age_months']),
                 breed=request.form['breed'],
                 gender=request.form['gender'],
                 status=AnimalStatus(request.form['status'])
             )
+            db.session.commit()
             
             flash('Данные обновлены', 'success')
             return redirect(url_for('animals.show', animal_id=animal.id))
         except Exception as e:
+            db.session.rollback()
             current_app.logger.error(f"Error updating animal: {e}")
             flash('При сохранении данных возникла ошибка', 'danger')
     
@@ -144,8 +172,10 @@ def edit(animal_id):
 def delete(animal_id):
     try:
         animal_repo.delete_animal(animal_id)
+        db.session.commit()
         flash('Животное успешно удалено', 'success')
     except Exception as e:
+        db.session.rollback()
         current_app.logger.error(f"Error deleting animal: {e}")
         flash('Ошибка при удалении животного', 'danger')
     
@@ -154,29 +184,26 @@ def delete(animal_id):
 @bp.route('/<int:animal_id>/adopt', methods=['POST'])
 @login_required
 def create_adoption(animal_id):
-    animal = animal_repo.get_animal_by_id(animal_id)
-    if not animal:
-        flash('Животное не найдено', 'danger')
-        return redirect(url_for('animals.index'))
-    
-    if animal.status not in (AnimalStatus.AVAILABLE, AnimalStatus.ADOPTION):
-        flash('Это животное уже не доступно для усыновления', 'warning')
-        return redirect(url_for('animals.show', animal_id=animal_id))
-    
-    if adoption_repo.has_user_adoption(current_user.id, animal_id):
-        flash('Вы уже подавали заявку на это животное', 'warning')
-        return redirect(url_for('animals.show', animal_id=animal_id))
-    
     try:
-        adoption_repo.create_adoption(
+        adoption_repo.submit(
             user_id=current_user.id,
             animal_id=animal_id,
             contact_info=request.form['contact_info']
         )
-        
-        animal_repo.update_animal_status(animal_id, AnimalStatus.ADOPTION)
+        db.session.commit()
         flash('Заявка подана успешно', 'success')
+    except AnimalNotFound:
+        db.session.rollback()
+        flash('Животное не найдено', 'danger')
+        return redirect(url_for('animals.index'))
+    except AnimalNotAvailable:
+        db.session.rollback()
+        flash('Это животное уже не доступно для усыновления', 'warning')
+    except DuplicateAdoption:
+        db.session.rollback()
+        flash('Вы уже подавали заявку на это животное', 'warning')
     except Exception as e:
+        db.session.rollback()
         current_app.logger.error(f"Error creating adoption: {e}")
         flash('Ошибка при подаче заявки', 'danger')
     
@@ -194,12 +221,58 @@ def process_adoption(adoption_id, action):
     try:
         if action == 'accept':
             adoption_repo.accept_adoption(adoption_id)
+            db.session.commit()
             flash('Заявка принята. Остальные заявки на это животное отклонены.', 'success')
         elif action == 'reject':
             adoption_repo.reject_adoption(adoption_id)
+            db.session.commit()
             flash('Заявка отклонена', 'info')
     except Exception as e:
+        db.session.rollback()
         current_app.logger.error(f"Error processing adoption: {e}")
         flash('Ошибка при обработке заявки', 'danger')
     
-    return redirect(url_for('animals.show', animal_id=adoption.animal_id))
\ No newline at end of file
+    return redirect(url_for('animals.show', animal_id=adoption.animal_id))
+
+@bp.route('/adoptions/bulk', methods=['POST'])
+@login_required
+@check_rights('process_adoption')
+def process_adoptions():
+    """
+    Обработка нескольких заявок. Принимает форму (adoption_ids, action,
+    animal_id для возврата на страницу животного) или JSON
+    {"ids": [...], "action": "accept" | "reject"}, на который отвечает JSON
+    с итогом по каждой заявке
+    """
+    payload = request.get_json(silent=True)
+    if payload is not None:
+        if not isinstance(payload, dict):
+            abort(400)
+        adoption_ids = payload.get('ids', [])
+        if not isinstance(adoption_ids, list):
+            abort(400)
+        action = payload.get('action')
+    else:
+        adoption_ids = request.form.getlist('adoption_ids')
+        action = request.form.get('action')
+
+    try:
+        adoption_ids = [int(adoption_id) for adoption_id in adoption_ids]
+        results = adoption_repo.process_many(adoption_ids, action)
+    except (TypeError, ValueError):
+        abort(400)
+    db.session.commit()
+
+    if payload is not None:
+        return jsonify({'results': {str(key): value for key, value in results.items()}})
+
+    processed = sum(1 for value in results.values() if value not in ('not_found', 'not_pending'))
+    if processed:
+        flash(f'Обработано заявок: {processed}', 'success')
+    if processed < len(results):
+        flash(f'Пропущено заявок (не найдены или уже обработаны): {len(results) - processed}', 'warning')
+
+    animal_id = request.form.get('animal_id', type=int)
+    if animal_id:
+        return redirect(url_for('animals.show', animal_id=animal_id))
+    return redirect(url_for('animals.index'))
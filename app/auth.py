@@ -1,10 +1,11 @@
 from functools import wraps
-from flask import Blueprint, render_template, flash, redirect, url_for, request
+from flask import Blueprint, render_template, flash, redirect, url_for, request, current_app
 from flask_login import login_user, logout_user, login_required, current_user, LoginManager
-from werkzeug.security import check_password_hash
+from sqlalchemy.exc import SQLAlchemyError
 
-from .models import db
+from .models import db, ROLE_ADMIN, ROLE_MODERATOR
 from .repositories.user_repository import UserRepository
+from .passwords import PasswordQueueFull, needs_rehash, rehash_password, verify_password
 
 user_repository = UserRepository(db)
 bp = Blueprint('auth', __name__, url_prefix='/auth')
@@ -17,10 +18,29 @@ def init_login_manager(app):
     login_manager.user_loader(load_user)
     login_manager.init_app(app)
 
+# Роли, которым разрешено действие из check_rights
+PERMISSIONS = {
+    'create_animal': {ROLE_ADMIN},
+    'edit_animal': {ROLE_ADMIN, ROLE_MODERATOR},
+    'delete_animal': {ROLE_ADMIN},
+    'process_adoption': {ROLE_ADMIN, ROLE_MODERATOR},
+    'view_metrics': {ROLE_ADMIN},
+}
+
 def load_user(user_id):
-    return user_repository.get_user_by_id(user_id)
+    try:
+        user_id = int(user_id)
+    except ValueError:
+        return None
+    return user_repository.get_user_snapshot(user_id)
+
+def has_permission(user, action):
+    return user.is_authenticated and user.role_id in PERMISSIONS[action]
 
 def check_rights(action):
+    if action not in PERMISSIONS:
+        raise ValueError(f"Unknown action: {action}")
+
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
@@ -28,16 +48,15 @@ def check_rights(action):
                 flash('Для выполнения данного действия необходимо пройти процедуру аутентификации', 'warning')
                 return redirect(url_for('auth.login', next=request.url))
 
-            if action == 'create_animal' and not current_user.is_admin:
-                flash('У вас недостаточно прав для выполнения данного действия', 'danger')
-                return redirect(url_for('main.index'))
-            elif action == 'edit_animal' and not (current_user.is_admin or current_user.is_moderator):
-                flash('У вас недостаточно прав для выполнения данного действия', 'danger')
-                return redirect(url_for('main.index'))
-            elif action == 'delete_animal' and not current_user.is_admin:
-                flash('У вас недостаточно прав для выполнения данного действия', 'danger')
-                return redirect(url_for('main.index'))
-            elif action == 'process_adoption' and not (current_user.is_admin or current_user.is_moderator):
+            # Снимок пользователя мог устареть в кэше другого воркера, поэтому
+            # для действий с правами роль берётся из базы
+            role_id = user_repository.get_role_id(current_user.id)
+            if role_id is None:
+                logout_user()
+                flash('Для выполнения данного действия необходимо пройти процедуру аутентификации', 'warning')
+                return redirect(url_for('auth.login', next=request.url))
+
+            if role_id not in PERMISSIONS[action]:
                 flash('У вас недостаточно прав для выполнения данного действия', 'danger')
                 return redirect(url_for('main.index'))
             
@@ -53,13 +72,40 @@ def login():
         remember = request.form.get('remember') == 'on'
         
         if login and password:
+            throttles = current_app.extensions['login_throttles']
+            # Для логина считаются только неудачные попытки: иначе любой, кто
+            # знает логин, мог бы не давать владельцу войти
+            if not throttles['ip'].hit(request.remote_addr) or throttles['login'].blocked(login):
+                flash('Слишком много попыток входа. Попробуйте позже', 'danger')
+                return render_template('auth/login.html'), 429
+
             user = user_repository.get_user_by_login(login)
-            if user and user.check_password(password):
+            try:
+                verified = user is not None and verify_password(user.password_hash, password)
+            except PasswordQueueFull:
+                current_app.logger.warning(f"Password verification queue is full, login {login!r} rejected")
+                flash('Сервер перегружен. Попробуйте войти позже', 'danger')
+                return render_template('auth/login.html'), 503
+
+            if verified:
+                if needs_rehash(user.password_hash):
+                    # Пароль уже проверен: неудачный пересчёт хеша не мешает
+                    # входу, хеш пересчитается при одном из следующих входов
+                    try:
+                        user.password_hash = rehash_password(password)
+                        db.session.commit()
+                    except PasswordQueueFull:
+                        current_app.logger.warning(f"Password queue is full, rehash for login {login!r} skipped")
+                    except SQLAlchemyError as e:
+                        db.session.rollback()
+                        current_app.logger.warning(f"Password rehash for login {login!r} not saved: {e}")
+                throttles['login'].reset(login)
                 login_user(user, remember=remember)
                 flash('Вы успешно аутентифицированы', 'success')
                 next_page = request.args.get('next')
                 return redirect(next_page or url_for('main.index'))
-        
+            throttles['login'].hit(login)
+
         flash('Невозможно аутентифицироваться с указанными логином и паролем', 'danger')
     
     return render_template('auth/login.html')
@@ -0,0 +1,141 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Потокобезопасный ограниченный LRU-кэш внутри процесса
+    :param maxsize: Максимальное число записей
+    :param ttl: Время жизни записи в секундах (None - без ограничения)
+    """
+
+    _missing = object()
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, self._missing)
+            if item is self._missing:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, self._missing) is not self._missing
+
+
+class GenerationalCache(LRUCache):
+    """
+    LRU-кэш с поколениями: bump() делает все записи устаревшими. Номер
+    поколения берётся в ключ до построения значения, поэтому значение,
+    посчитанное по данным до изменения, не попадёт в новое поколение
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.generation = 0
+
+    def bump(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+
+catalog_cache = GenerationalCache(maxsize=256)
+
+
+class SqliteCache:
+    """
+    Кэш ключ-значение в файле SQLite, общий для всех процессов на одной машине
+    (например, воркеров gunicorn). Значения сериализуются в JSON
+    :param path: Путь к файлу базы кэша
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+            )
+
+    @classmethod
+    def for_path(cls, path):
+        """Один экземпляр на файл в пределах процесса"""
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key, default=None):
+        try:
+            row = self._connect().execute(
+                'SELECT value FROM cache WHERE key = ?', (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            return default
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        try:
+            with self._connect() as connection:
+                connection.execute(
+                    'INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)',
+                    (key, json.dumps(value))
+                )
+        except sqlite3.Error:
+            # Кэш не обязателен: при блокировке файла просто не сохраняем
+            pass
+
+    def delete(self, key):
+        try:
+            with self._connect() as connection:
+                connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+        except sqlite3.Error:
+            pass
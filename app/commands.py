@@ -0,0 +1,154 @@
+import time
+
+import click
+from flask.cli import AppGroup, with_appcontext
+
+from .models import db
+from .repositories.adoption_repository import AdoptionRepository
+from .repositories.animal_repository import AnimalRepository
+from .repositories.image_repository import ImageRepository
+from .seed import SEED_PASSWORD, seed_data
+
+animals_cli = AppGroup('animals', help='Animal data maintenance.')
+images_cli = AppGroup('images', help='Image storage maintenance.')
+
+def init_commands(app):
+    app.cli.add_command(animals_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(seed)
+
+@click.command('seed')
+@with_appcontext
+@click.option('--animals', default=0, show_default=True, help='Number of animals to create.')
+@click.option('--adoptions', default=0, show_default=True, help='Number of adoption applications to create.')
+@click.option('--images', default=0, show_default=True, help='Number of images to attach to animals.')
+@click.option('--users', type=int, help='Number of users (default: enough for the adoptions).')
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows per INSERT batch.')
+def seed(animals, adoptions, images, users, chunk_size):
+    """Fill the database with synthetic data in bulk inserts."""
+    created = seed_data(
+        animals=animals,
+        adoptions=adoptions,
+        images=images,
+        users=users,
+        chunk_size=chunk_size,
+        progress=click.echo
+    )
+    click.echo(', '.join(f'{count} {table}' for table, count in created.items()) + ' created.')
+    if created['users']:
+        click.echo(f'Seeded users log in with password {SEED_PASSWORD!r}.')
+
+@animals_cli.command('recount-adoptions')
+@click.option('--fix', is_flag=True, help='Repair the mismatches that were found.')
+def recount_adoptions(fix):
+    """Verify animal adoption counters against the adoptions table."""
+    adoption_repo = AdoptionRepository(db)
+    mismatches = adoption_repo.verify_counters()
+    for animal_id, stored, actual in mismatches:
+        click.echo(
+            f'animal {animal_id}: stored total={stored[0]} pending={stored[1]}, '
+            f'actual total={actual[0]} pending={actual[1]}'
+        )
+
+    if not mismatches:
+        click.echo('Counters are consistent.')
+    elif fix:
+        fixed = adoption_repo.repair_counters()
+        db.session.commit()
+        click.echo(f'Fixed {fixed} animal(s).')
+    else:
+        raise click.ClickException(
+            f'{len(mismatches)} animal(s) have stale counters, rerun with --fix.'
+        )
+
+@animals_cli.command('reindex')
+def reindex():
+    """Rebuild the animal search index."""
+    indexed = AnimalRepository(db).rebuild_search_index()
+    db.session.commit()
+    if indexed is None:
+        click.echo('The database maintains the FULLTEXT index itself, nothing to rebuild.')
+    else:
+        click.echo(f'Indexed {indexed} animal(s).')
+
+@animals_cli.command('import')
+@click.argument('source', type=click.Path(exists=True, dir_okay=False))
+@click.option('--images-dir', type=click.Path(exists=True, file_okay=False),
+              help='Folder that image file names in the records are relative to.')
+@click.option('--chunk-size', default=500, show_default=True,
+              help='Records per INSERT batch and transaction.')
+@click.option('--workers', type=int,
+              help='Processes for image hashing and Markdown rendering '
+                   '(default: CPU count, 0 or 1: in this process).')
+@click.option('--state-file', type=click.Path(dir_okay=False),
+              help='File that identifies the run to resume (default: <source>.import-state.json).')
+@click.option('--restart', is_flag=True, help='Ignore saved progress and start from the first record.')
+def import_animals(source, images_dir, chunk_size, workers, state_file, restart):
+    """Import animals and their images from a CSV or JSON Lines file.
+
+    Records have the fields name, description, age_months, breed, gender,
+    status (optional) and images: a list in JSON Lines or file names
+    separated by ';' in CSV.
+    """
+    # Пул процессов и импортёр нужны только этой команде, а не каждому запуску приложения
+    from .importer import ImportRecordError, import_animals as run_import
+
+    try:
+        result = run_import(
+            source,
+            images_dir=images_dir,
+            chunk_size=chunk_size,
+            workers=workers,
+            state_path=state_file,
+            restart=restart,
+            progress=click.echo
+        )
+    except ImportRecordError as e:
+        raise click.ClickException(f'{e}. Fix the record and rerun the command to resume.')
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    except Exception:
+        click.echo('Import stopped, rerun the command to resume after the last saved batch.', err=True)
+        raise
+
+    seconds = max(result['seconds'], 1e-6)
+    click.echo(
+        f"Imported {result['animals']} animal(s) and {result['images']} image(s), "
+        f"skipped {result['duplicate_images']} duplicate image(s) in {seconds:.1f}s: "
+        f"{result['animals'] / seconds:.0f} animals/s, {result['images'] / seconds:.0f} images/s, "
+        f"{result['image_bytes'] / seconds / 2 ** 20:.1f} MB/s of images."
+    )
+
+@images_cli.command('migrate-blobs')
+def migrate_blobs():
+    """Move images uploaded before the blob store into it."""
+    image_repo = ImageRepository(db)
+    moved = skipped = 0
+    for image in image_repo.get_legacy_images():
+        if image_repo.move_to_blob_store(image):
+            moved += 1
+        else:
+            skipped += 1
+            click.echo(f'Skipped image {image.id}: file is missing or duplicates another image')
+    click.echo(f'Moved {moved} image(s), skipped {skipped}.')
+
+@images_cli.command('process-pending')
+@click.option('--watch', is_flag=True, help='Keep polling for new uploads.')
+@click.option('--interval', default=2.0, show_default=True, help='Polling interval in seconds.')
+@click.option('--stuck', is_flag=True, help='Also retry images left in PROCESSING by a crashed worker.')
+def process_pending(watch, interval, stuck):
+    """Process uploaded images waiting for hashing and derivatives."""
+    image_repo = ImageRepository(db)
+    while True:
+        image_ids = image_repo.get_pending_image_ids(include_stuck=stuck)
+        for image_id in image_ids:
+            try:
+                image_repo.process_image(image_id, include_stuck=stuck)
+                click.echo(f'Processed image {image_id}')
+            except Exception as e:
+                click.echo(f'Failed to process image {image_id}: {e}', err=True)
+        stuck = False
+        if not watch:
+            break
+        db.session.remove()
+        time.sleep(interval)
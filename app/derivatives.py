@@ -0,0 +1,166 @@
+import glob
+import os
+import tempfile
+
+from flask import current_app
+
+try:
+    from PIL import Image as PILImage, ImageOps
+except ImportError:  # Pillow не установлен: отдаются только оригиналы
+    PILImage = None
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+}
+
+EXIF_ORIENTATION = 0x0112
+
+# Форматы, которые имеет смысл уменьшать (GIF может быть анимированным)
+RESIZABLE_MIME_TYPES = {'image/jpeg', 'image/png'}
+
+# Допустимые расширения загружаемых изображений и форматы Pillow -> MIME тип.
+# Тип, который прислал клиент, не используется: его отдают как Content-Type
+MIME_TYPES_BY_EXTENSION = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'gif': 'image/gif',
+}
+MIME_TYPES_BY_PIL_FORMAT = {
+    'PNG': 'image/png',
+    'JPEG': 'image/jpeg',
+    'GIF': 'image/gif',
+}
+# Типы, которые отдаются как есть; остальное - application/octet-stream
+SERVED_MIME_TYPES = {
+    *MIME_TYPES_BY_EXTENSION.values(),
+    *(mime_type for _, mime_type in FORMATS.values()),
+}
+
+def derivative_filename(filename, size, fmt=None):
+    """Имя производного файла рядом с оригиналом: <оригинал>.<size>[.<fmt>]"""
+    return f'{filename}.{size}.{fmt}' if fmt else f'{filename}.{size}'
+
+def mime_type_for(filename):
+    """MIME тип по расширению файла или None, если расширение не допускается"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return MIME_TYPES_BY_EXTENSION.get(extension)
+
+def detect_mime_type(path, filename):
+    """
+    MIME тип изображения по содержимому файла, а без Pillow - по расширению
+    filename
+    :raises ValueError: если файл не является изображением допустимого формата
+    """
+    if PILImage is None:
+        mime_type = mime_type_for(filename)
+    else:
+        try:
+            with PILImage.open(path) as source:
+                mime_type = MIME_TYPES_BY_PIL_FORMAT.get(source.format)
+        except OSError as e:
+            raise ValueError(f"{filename}: not an image") from e
+    if mime_type is None:
+        raise ValueError(f"{filename}: unsupported image type")
+    return mime_type
+
+def remove_derivatives(file_path):
+    """Удалить все производные файлы оригинала"""
+    for path in glob.glob(glob.escape(file_path) + '.*'):
+        os.remove(path)
+
+def get_derivative(filename, mime_type, size, fmt=None):
+    """
+    Найти или создать уменьшенную копию изображения
+    :param filename: Путь к оригиналу относительно UPLOAD_FOLDER
+    :param mime_type: MIME тип оригинала
+    :param size: Ключ из IMAGE_SIZES
+    :param fmt: Ключ из FORMATS или None, чтобы сохранить формат оригинала
+    :return: (путь относительно UPLOAD_FOLDER, MIME тип) или None, если отдавать
+             нужно оригинал
+    """
+    width = current_app.config['IMAGE_SIZES'].get(size)
+    if (PILImage is None or width is None or mime_type not in RESIZABLE_MIME_TYPES
+            or (fmt is not None and fmt not in FORMATS)):
+        return None
+
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    result = derivative_filename(filename, size, fmt)
+    result_mime_type = FORMATS[fmt][1] if fmt else mime_type
+    if os.path.exists(os.path.join(upload_folder, result)):
+        return result, result_mime_type
+
+    try:
+        _render(
+            os.path.join(upload_folder, filename),
+            os.path.join(upload_folder, result),
+            width,
+            FORMATS[fmt][0] if fmt else None
+        )
+    except (OSError, ValueError) as e:
+        current_app.logger.error(f"Error creating {size} derivative of {filename}: {e}")
+        return None
+    return result, result_mime_type
+
+def generate_derivatives(filename, mime_type):
+    """Заранее создать все размеры и форматы изображения"""
+    for size in current_app.config['IMAGE_SIZES']:
+        for fmt in (None, *FORMATS):
+            get_derivative(filename, mime_type, size, fmt)
+
+def strip_metadata(path, mime_type):
+    """
+    Удалить EXIF и прочие метаданные из файла на месте. Ориентация из EXIF
+    применяется к пикселям, чтобы фото не оказалось повёрнутым
+    """
+    if PILImage is None or mime_type not in RESIZABLE_MIME_TYPES:
+        return
+
+    with PILImage.open(path) as source:
+        exif = source.getexif()
+        if not exif:
+            return
+
+        save_options = {}
+        if exif.get(EXIF_ORIENTATION, 1) != 1:
+            image = ImageOps.exif_transpose(source)
+            if source.format == 'JPEG':
+                save_options['quality'] = 95
+        else:
+            image = source
+            if source.format == 'JPEG':
+                # Без поворота пиксели не меняются: сохраняем исходные
+                # таблицы квантования, чтобы не терять качество
+                save_options['quality'] = 'keep'
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.strip-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                image.save(out, format=source.format, **save_options)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, path)
+
+def _render(source_path, target_path, width, pil_format):
+    with PILImage.open(source_path) as source:
+        pil_format = pil_format or source.format
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail((width, width))
+        if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        # Запись через временный файл, чтобы параллельный запрос не увидел
+        # недописанную копию
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), prefix='.derivative-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                image.save(
+                    out,
+                    format=pil_format,
+                    quality=current_app.config['IMAGE_DERIVATIVE_QUALITY']
+                )
+            os.replace(tmp_path, target_path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
@@ -0,0 +1,359 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+from flask import current_app
+from sqlalchemy import insert
+from werkzeug.utils import secure_filename
+
+from . import search
+from .cache import catalog_cache
+from .derivatives import detect_mime_type, generate_derivatives, mime_type_for, strip_metadata
+from .models import db, Animal, AnimalStatus, Blob, Image, ImageState, ImportProgress
+from .rendering import content_hash, render_markdown
+from .repositories.blob_repository import BlobRepository
+from .unit_of_work import on_commit
+
+GENDERS = {'male', 'female'}
+IMPORT_FORMATS = ('.csv', '.jsonl')
+# Разделитель имён файлов в столбце images CSV
+CSV_IMAGES_SEPARATOR = ';'
+CHUNK_SIZE = 64 * 1024
+
+class ImportRecordError(ValueError):
+    """Запись файла импорта нельзя импортировать"""
+
+    def __init__(self, line, message):
+        super().__init__(f'line {line}: {message}')
+        self.line = line
+
+def import_animals(source, images_dir=None, chunk_size=500, workers=None,
+                   state_path=None, restart=False, progress=None):
+    """
+    Импортировать животных из CSV или JSON Lines пакетами: строки animals
+    вставляются одним INSERT на пакет, изображения копируются, очищаются от
+    метаданных и хешируются в пуле процессов, одинаковые файлы хранятся в
+    blobs один раз. Каждый пакет - отдельная транзакция, в которой вместе с
+    данными сохраняется и число импортированных записей (import_progress),
+    поэтому повторный запуск после ошибки или сбоя продолжает ровно с первой
+    несохранённой записи. Файл состояния хранит только id запуска
+    :param source: Путь к файлу .csv или .jsonl
+    :param images_dir: Папка, относительно которой указаны файлы изображений
+    :param chunk_size: Записей в пакете
+    :param workers: Процессов для изображений и описаний (по умолчанию по
+                    числу CPU, 0 или 1 - в текущем процессе)
+    :param state_path: Файл состояния с id запуска, по умолчанию
+                       <source>.import-state.json
+    :param restart: Начать сначала, не учитывая сохранённый прогресс
+    :param progress: Функция для вывода хода импорта
+    :return: Словарь с итогами импорта
+    :raises ImportRecordError: если запись некорректна; сохранённые пакеты
+                               остаются, повторный запуск продолжит с пакета
+                               с ошибкой
+    :raises ValueError: если формат файла не поддерживается
+    """
+    progress = progress or (lambda message: None)
+    source = os.path.abspath(source)
+    if not source.endswith(IMPORT_FORMATS):
+        raise ValueError(f"Unsupported import file {source!r}: expected {' or '.join(IMPORT_FORMATS)}")
+    state_path = state_path or source + '.import-state.json'
+    state = _load_state(state_path, source)
+    if state is not None and restart:
+        _forget_progress(state['run_id'])
+        state = None
+    if state is None:
+        state = {'source': source, 'run_id': str(uuid.uuid4())}
+        _save_state(state_path, state)
+    done = _saved_records(state['run_id'])
+    if done:
+        progress(f"Resuming after record {done}")
+
+    totals = {key: 0 for key in ('animals', 'images', 'duplicate_images', 'image_bytes')}
+    started = time.perf_counter()
+    records = islice(_read_records(source), done, None)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    # С одним процессом пул только добавляет пересылку данных между процессами
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for chunk in _chunks(records, chunk_size):
+            done += len(chunk)
+            result = _import_chunk(chunk, images_dir, executor,
+                                   ImportProgress(run_id=state['run_id'], source=source, records=done))
+            for key, value in result.items():
+                totals[key] += value
+
+            elapsed = time.perf_counter() - started
+            progress(
+                f"  records: {done}, "
+                f"{totals['animals'] / elapsed:.0f} animals/s, "
+                f"{totals['images'] / elapsed:.0f} images/s"
+            )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    _forget_progress(state['run_id'])
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    totals['records'] = done
+    totals['seconds'] = time.perf_counter() - started
+    return totals
+
+def _import_chunk(chunk, images_dir, executor, import_progress):
+    session = db.session
+    run = executor.map if executor is not None else map
+    rows = [_animal_row(line, record) for line, record in chunk]
+    image_files = [
+        (index, path)
+        for index, (line, record) in enumerate(chunk)
+        for path in _image_files(line, record, images_dir)
+    ]
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    os.makedirs(upload_folder, exist_ok=True)
+
+    # Markdown описаний и файлы изображений обрабатываются параллельно
+    descriptions = [row['description'] for row in rows]
+    if executor is not None:
+        rendered = executor.map(_render_description, descriptions, chunksize=64)
+    else:
+        rendered = map(_render_description, descriptions)
+    for row, (html, digest) in zip(rows, rendered):
+        row['description_html'] = html
+        row['description_hash'] = digest
+
+    prepared = []
+    try:
+        for result in run(
+            _prepare_image,
+            [path for _, path in image_files],
+            [upload_folder] * len(image_files)
+        ):
+            prepared.append(result)
+        for (index, path), (_, _, _, mime_type) in zip(image_files, prepared):
+            if mime_type is None:
+                raise ImportRecordError(chunk[index][0], f'{os.path.basename(path)}: not a supported image')
+    except Exception:
+        for tmp_path, _, _, _ in prepared:
+            os.remove(tmp_path)
+        raise
+
+    blob_repository = BlobRepository(db)
+    created = []
+    pending = [tmp_path for tmp_path, _, _, _ in prepared]
+    try:
+        animal_ids = _insert_animals(session, rows, {index for index, _ in image_files})
+        search.index_new_animals(session, [
+            dict(row, id=animal_id) for row, animal_id in zip(rows, animal_ids)
+        ])
+
+        images = []
+        seen = set()
+        for (index, path), (tmp_path, blob_hash, size, mime_type) in zip(image_files, prepared):
+            # Тот же файл дважды у одного животного сохраняется один раз
+            if (animal_ids[index], blob_hash) in seen:
+                os.remove(tmp_path)
+                pending.remove(tmp_path)
+                continue
+            seen.add((animal_ids[index], blob_hash))
+            created_path = blob_repository.acquire(tmp_path, blob_hash, size, mime_type)
+            pending.remove(tmp_path)
+            created.append((blob_hash, created_path))
+            images.append({
+                'id': str(uuid.uuid4()),
+                'file_name': secure_filename(os.path.basename(path)),
+                'mime_type': mime_type,
+                'animal_id': animal_ids[index],
+                'blob_hash': blob_hash,
+                'processing_state': ImageState.READY,
+            })
+        if images:
+            session.execute(insert(Image), images)
+
+        # Число сохранённых записей фиксируется в той же транзакции
+        session.merge(import_progress)
+        on_commit(session, catalog_cache.bump)
+        session.commit()
+    except Exception:
+        session.rollback()
+        for blob_hash, created_path in created:
+            blob_repository.discard_created_file(blob_hash, created_path)
+        for tmp_path in pending:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise
+
+    if current_app.config.get('IMAGE_DERIVATIVES_ON_UPLOAD'):
+        for image in images:
+            generate_derivatives(Blob.path_for(image['blob_hash']), image['mime_type'])
+    return {
+        'animals': len(rows),
+        'images': len(images),
+        'duplicate_images': len(image_files) - len(images),
+        'image_bytes': sum(size for _, _, size, _ in prepared),
+    }
+
+def _insert_animals(session, rows, need_ids):
+    """
+    Вставить пакет животных и вернуть их ID в порядке rows. Если база умеет
+    INSERT ... RETURNING для нескольких строк (SQLite, MariaDB), это один
+    запрос. MySQL его не поддерживает: животные без изображений вставляются
+    одним executemany без ID (индекс FULLTEXT обновляет сама база), а
+    остальные - по одному, чтобы получить ID
+    """
+    statement = insert(Animal)
+    if session.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        return session.execute(
+            statement.returning(Animal.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+
+    without_ids = [row for index, row in enumerate(rows) if index not in need_ids]
+    if without_ids:
+        session.execute(statement, without_ids)
+    return [
+        session.execute(statement, row).inserted_primary_key[0] if index in need_ids else None
+        for index, row in enumerate(rows)
+    ]
+
+def _animal_row(line, record):
+    """Проверить запись и вернуть строку для INSERT в animals"""
+    row = {}
+    for field, max_length in (('name', 50), ('breed', 100), ('description', None)):
+        value = (record.get(field) or '').strip()
+        if not value:
+            raise ImportRecordError(line, f'{field} is required')
+        if max_length and len(value) > max_length:
+            raise ImportRecordError(line, f'{field} is longer than {max_length} characters')
+        row[field] = value
+
+    try:
+        row['age_months'] = int(record.get('age_months'))
+    except (TypeError, ValueError):
+        raise ImportRecordError(line, f"age_months must be an integer, got {record.get('age_months')!r}")
+    if row['age_months'] < 0:
+        raise ImportRecordError(line, 'age_months must not be negative')
+
+    row['gender'] = (record.get('gender') or '').strip()
+    if row['gender'] not in GENDERS:
+        raise ImportRecordError(line, f"gender must be one of {', '.join(sorted(GENDERS))}")
+    try:
+        row['status'] = AnimalStatus(record.get('status') or AnimalStatus.AVAILABLE.value)
+    except ValueError:
+        raise ImportRecordError(line, f"unknown status {record.get('status')!r}")
+
+    row['created_at'] = datetime.now()
+    row['adoption_count'] = 0
+    row['pending_count'] = 0
+    return row
+
+def _image_files(line, record, images_dir):
+    """Пути к изображениям записи"""
+    names = record.get('images') or []
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(CSV_IMAGES_SEPARATOR) if name.strip()]
+    if names and images_dir is None:
+        raise ImportRecordError(line, 'the record has images, but --images-dir is not set')
+
+    files = []
+    for name in names:
+        path = os.path.join(images_dir, name)
+        if mime_type_for(name) is None:
+            raise ImportRecordError(line, f'{name}: unsupported image type')
+        if not os.path.isfile(path):
+            raise ImportRecordError(line, f'{name}: file not found in {images_dir}')
+        files.append(path)
+    return files
+
+def _render_description(text):
+    """HTML и хеш описания, как в Animal.set_description (выполняется в пуле)"""
+    return render_markdown(text), content_hash(text)
+
+def _prepare_image(path, upload_folder):
+    """
+    Скопировать изображение во временный файл в UPLOAD_FOLDER, определить тип
+    по содержимому, удалить метаданные и посчитать хеш, как process_image
+    (выполняется в пуле)
+    :return: (временный файл, SHA-256, размер, MIME тип или None, если файл
+             не является изображением допустимого формата)
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=upload_folder, prefix='.import-')
+    try:
+        with os.fdopen(fd, 'wb') as out, open(path, 'rb') as source:
+            shutil.copyfileobj(source, out, CHUNK_SIZE)
+        try:
+            mime_type = detect_mime_type(tmp_path, path)
+        except ValueError:
+            mime_type = None
+        else:
+            strip_metadata(tmp_path, mime_type)
+
+        digest = hashlib.sha256()
+        size = 0
+        with open(tmp_path, 'rb') as source:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size, mime_type
+
+def _read_records(path):
+    """Записи файла импорта: (номер строки, словарь)"""
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8-sig') as source:
+            reader = csv.DictReader(source)
+            for record in reader:
+                yield reader.line_num, record
+    elif path.endswith('.jsonl'):
+        with open(path, encoding='utf-8') as source:
+            for line, text in enumerate(source, 1):
+                if not text.strip():
+                    continue
+                try:
+                    record = json.loads(text)
+                except ValueError as e:
+                    raise ImportRecordError(line, f'invalid JSON: {e}')
+                if not isinstance(record, dict):
+                    raise ImportRecordError(line, 'a JSON object is expected')
+                yield line, record
+
+def _chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _saved_records(run_id):
+    progress = db.session.get(ImportProgress, run_id)
+    return progress.records if progress is not None else 0
+
+def _forget_progress(run_id):
+    db.session.execute(db.delete(ImportProgress).where(ImportProgress.run_id == run_id))
+    db.session.commit()
+
+def _load_state(path, source):
+    if not os.path.exists(path):
+        return None
+    with open(path) as state_file:
+        state = json.load(state_file)
+    return state if state.get('source') == source and 'run_id' in state else None
+
+def _save_state(path, state):
+    # Запись через временный файл: после сбоя остаётся либо старое, либо новое состояние
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as state_file:
+        json.dump(state, state_file)
+    os.replace(tmp_path, path)
@@ -0,0 +1,191 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from .models import db
+
+# Границы корзин гистограмм (включительно), последняя корзина - +Inf
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+class Histogram:
+    """Гистограмма в формате Prometheus: счётчики по корзинам, сумма и количество"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, label):
+        """Строки _bucket, _sum и _count для текстового формата Prometheus"""
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{label}}} {self.sum:.6f}')
+        lines.append(f'{name}_count{{{label}}} {self.count}')
+        return lines
+
+class RequestMetrics:
+    """Гистограммы длительности запроса, числа и времени SQL-запросов по endpoint"""
+
+    HISTOGRAMS = {
+        'http_request_duration_seconds': ('Request duration', DURATION_BUCKETS),
+        'db_queries_per_request': ('SQL statements executed per request', QUERY_COUNT_BUCKETS),
+        'db_time_per_request_seconds': ('Time spent in SQL statements per request', DURATION_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {name: {} for name in self.HISTOGRAMS}
+
+    def observe(self, endpoint, duration, queries, db_time):
+        values = {
+            'http_request_duration_seconds': duration,
+            'db_queries_per_request': queries,
+            'db_time_per_request_seconds': db_time,
+        }
+        with self._lock:
+            for name, value in values.items():
+                by_endpoint = self._histograms[name]
+                if endpoint not in by_endpoint:
+                    by_endpoint[endpoint] = Histogram(self.HISTOGRAMS[name][1])
+                by_endpoint[endpoint].observe(value)
+
+    def render_prometheus(self):
+        """Все гистограммы в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            for name, (help_text, _) in self.HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for endpoint, histogram in sorted(self._histograms[name].items()):
+                    lines += histogram.render(name, f'endpoint="{endpoint}"')
+        return '\n'.join(lines) + '\n'
+
+class PoolMetrics:
+    """
+    Метрики пулов соединений: время ожидания свободного соединения, число
+    выдач и новых соединений, текущая занятость пула
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engines = {}
+        self._waits = {}
+        self._counters = {}
+
+    def watch(self, name, engine):
+        self._engines[name] = engine
+        self._waits[name] = Histogram(DURATION_BUCKETS)
+        self._counters[name] = {'checkouts': 0, 'connects': 0}
+        self._time_checkouts(name, engine.pool)
+        # dispose() (например, после fork в воркере) заменяет пул новым. Слушатели
+        # событий переходят к новому пулу сами, замер ожидания ставится заново
+        event.listen(engine, 'engine_disposed', lambda engine: self._time_checkouts(name, engine.pool))
+        event.listen(engine.pool, 'checkout', lambda *_: self._count(name, 'checkouts'))
+        event.listen(engine.pool, 'connect', lambda *_: self._count(name, 'connects'))
+
+    def _time_checkouts(self, name, pool):
+        # QueuePool не сообщает, сколько ждали соединение, поэтому замеряется
+        # сам метод получения соединения из очереди
+        do_get = pool._do_get
+
+        def timed_do_get():
+            started = time.perf_counter()
+            try:
+                return do_get()
+            finally:
+                with self._lock:
+                    self._waits[name].observe(time.perf_counter() - started)
+
+        pool._do_get = timed_do_get
+
+    def _count(self, name, counter):
+        with self._lock:
+            self._counters[name][counter] += 1
+
+    def render_prometheus(self):
+        """Метрики пулов в текстовом формате Prometheus"""
+        lines = [
+            '# HELP db_pool_wait_seconds Time spent waiting for a pooled connection',
+            '# TYPE db_pool_wait_seconds histogram',
+        ]
+        with self._lock:
+            for name, histogram in sorted(self._waits.items()):
+                lines += histogram.render('db_pool_wait_seconds', f'engine="{name}"')
+            for counter in ('checkouts', 'connects'):
+                lines.append(f'# TYPE db_pool_{counter}_total counter')
+                for name, counters in sorted(self._counters.items()):
+                    lines.append(f'db_pool_{counter}_total{{engine="{name}"}} {counters[counter]}')
+
+        # Размер и занятость есть только у QueuePool
+        for gauge in ('size', 'checkedout', 'overflow'):
+            lines.append(f'# TYPE db_pool_{gauge} gauge')
+            for name, engine in sorted(self._engines.items()):
+                method = getattr(engine.pool, gauge, None)
+                if method is not None:
+                    lines.append(f'db_pool_{gauge}{{engine="{name}"}} {method()}')
+        return '\n'.join(lines) + '\n'
+
+def init_instrumentation(app):
+    """
+    Подсчёт SQL-запросов и времени в базе для каждого HTTP-запроса: заголовок
+    Server-Timing, журнал медленных запросов и гистограммы по endpoint
+    """
+    if not app.config.get('SQL_INSTRUMENTATION', True):
+        return
+    metrics = app.extensions['request_metrics'] = RequestMetrics()
+    slow_query_seconds = app.config.get('SLOW_QUERY_MS', 200) / 1000
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        endpoint = None
+        if has_request_context() and 'sql_queries' in g:
+            g.sql_queries += 1
+            g.sql_time += elapsed
+            endpoint = request.endpoint
+        if elapsed >= slow_query_seconds:
+            app.logger.warning(
+                f"Slow query ({elapsed * 1000:.1f} ms) in {endpoint or 'background'}: "
+                f"{' '.join(statement.split())}"
+            )
+
+    pool_metrics = app.extensions['pool_metrics'] = PoolMetrics()
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+            pool_metrics.watch(bind_key or 'primary', engine)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_time = 0.0
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'request_started' not in g:
+            return response
+        duration = time.perf_counter() - g.request_started
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={g.sql_time * 1000:.2f};desc="{g.sql_queries} queries", '
+            f'app;dur={duration * 1000:.2f}'
+        )
+        metrics.observe(request.endpoint or 'unmatched', duration, g.sql_queries, g.sql_time)
+        return response
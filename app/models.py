@@ -2,15 +2,19 @@ import os
 from datetime import datetime
 from enum import Enum
 import uuid
-from flask import url_for
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy import UUID, String, ForeignKey, Text, Integer, MetaData, Date, Enum as SQLAlchemyEnum
-from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy import DDL, Computed, Index, UniqueConstraint, event
+from werkzeug.security import check_password_hash
 from typing import List, Optional
 
+from .passwords import hash_password
+from .replicas import RoutingSession
+from .rendering import content_hash, render_markdown
+
 class Base(DeclarativeBase):
     metadata = MetaData(naming_convention={
         "ix": 'ix_%(column_0_label)s',
@@ -20,19 +24,32 @@ class Base(DeclarativeBase):
         "pk": "pk_%(table_name)s"
     })
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 
 class AnimalStatus(str, Enum):
     AVAILABLE = 'available'
     ADOPTION = 'adoption'
     ADOPTED = 'adopted'
 
+# Порядок статусов в каталоге: сначала доступные, затем в процессе усыновления
+ANIMAL_STATUS_RANK = {
+    AnimalStatus.AVAILABLE: 0,
+    AnimalStatus.ADOPTION: 1,
+    AnimalStatus.ADOPTED: 2,
+}
+
 class AdoptionStatus(str, Enum):
     PENDING = 'pending'
     ACCEPTED = 'accepted'
     REJECTED = 'rejected'
     REJECTED_ADOPTED = 'rejected_adopted'
 
+class ImageState(str, Enum):
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+
 class UserRole(Base):
     __tablename__ = "user_roles"
 
@@ -42,7 +59,31 @@ class UserRole(Base):
 
     users: Mapped[List["User"]] = relationship(back_populates="role")
 
-class User(Base, UserMixin):
+# Идентификаторы ролей из таблицы user_roles
+ROLE_ADMIN = 1
+ROLE_MODERATOR = 2
+ROLE_USER = 3
+
+class RoleMixin:
+    """Свойства пользователя, которые вычисляются по role_id и ФИО без обращения к базе"""
+
+    @property
+    def full_name(self):
+        return f"{self.last_name} {self.first_name} {self.middle_name or ''}".strip()
+
+    @property
+    def is_admin(self):
+        return self.role_id == ROLE_ADMIN
+
+    @property
+    def is_moderator(self):
+        return self.role_id == ROLE_MODERATOR
+
+    @property
+    def is_user(self):
+        return self.role_id == ROLE_USER
+
+class User(Base, RoleMixin, UserMixin):
     __tablename__ = "users"
 
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -58,55 +99,114 @@ class User(Base, UserMixin):
     adoptions: Mapped[List["Adoption"]] = relationship(back_populates="user")
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
-    
-    @property
-    def full_name(self):
-        return f"{self.last_name} {self.first_name} {self.middle_name or ''}".strip()
-    
-    @property
-    def is_admin(self):
-        return self.role_id == 1
-    
-    @property
-    def is_moderator(self):
-        return self.role_id == 2
-    
+
+class UserSnapshot(RoleMixin, UserMixin):
+    """
+    Неизменяемая копия данных пользователя, нужных для авторизации и шапки
+    страницы. Хранится в кэше процесса и не привязана к сессии базы
+    """
+
+    def __init__(self, id, login, role_id, first_name, last_name, middle_name=None):
+        self.id = id
+        self.login = login
+        self.role_id = role_id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.middle_name = middle_name
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(
+            user.id,
+            user.login,
+            user.role_id,
+            user.first_name,
+            user.last_name,
+            user.middle_name
+        )
+
+class Blob(Base):
+    """Содержимое файла, хранимое один раз независимо от числа ссылок на него"""
+    __tablename__ = "blobs"
+
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    mime_type: Mapped[str] = mapped_column(String(100), nullable=False)
+    refcount: Mapped[int] = mapped_column(Integer, default=0, server_default='0', nullable=False)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+
+    images: Mapped[List["Image"]] = relationship(back_populates="blob")
+
+    @staticmethod
+    def path_for(blob_hash):
+        # Каталоги ab/cd/ не дают файлам скапливаться в одной директории
+        return f"{blob_hash[:2]}/{blob_hash[2:4]}/{blob_hash}"
+
     @property
-    def is_user(self):
-        return self.role_id == 3
+    def storage_filename(self):
+        return self.path_for(self.hash)
 
 class Image(Base):
     __tablename__ = "images"
+    __table_args__ = (
+        UniqueConstraint('animal_id', 'blob_hash'),
+    )
 
     id: Mapped[str] = mapped_column(String(100), primary_key=True)
     file_name: Mapped[str] = mapped_column(String(100), nullable=False)
     mime_type: Mapped[str] = mapped_column(String(100), nullable=False)
-    md5_hash: Mapped[str] = mapped_column(String(100), unique=True)
+    md5_hash: Mapped[Optional[str]] = mapped_column(String(100))
     object_id: Mapped[Optional[int]]
     object_type: Mapped[Optional[str]] = mapped_column(String(100))
 
     animal_id: Mapped[int] = mapped_column(ForeignKey("animals.id"), nullable=False)
     animal: Mapped["Animal"] = relationship(back_populates="images")
+    blob_hash: Mapped[Optional[str]] = mapped_column(ForeignKey("blobs.hash"))
+    blob: Mapped[Optional["Blob"]] = relationship(back_populates="images")
+    processing_state: Mapped[ImageState] = mapped_column(
+        SQLAlchemyEnum(ImageState),
+        default=ImageState.READY,
+        server_default=ImageState.READY.name,
+        nullable=False
+    )
+    # Порядок загрузки: первое готовое изображение - обложка животного
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+
+    @property
+    def content_hash(self):
+        # У изображений, загруженных до хранилища blobs, есть только MD5
+        return self.blob_hash or self.md5_hash or self.id
+
+    @property
+    def is_ready(self):
+        return self.processing_state == ImageState.READY
+
+    @property
+    def incoming_filename(self):
+        return f".incoming/{self.id}"
 
     @property
     def storage_filename(self):
+        if self.blob_hash:
+            return Blob.path_for(self.blob_hash)
+        # Изображения, загруженные до появления хранилища blobs
         _, ext = os.path.splitext(self.file_name)
         return self.id + ext
 
-    @property
-    def url(self):
-        return url_for('main.serve_image', image_id=self.id)
-
 class Animal(Base):
     __tablename__ = "animals"
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(50), nullable=False)
-    description: Mapped[str] = mapped_column(Text, nullable=False)
+    # Исходный Markdown нужен только форме редактирования и индексу поиска,
+    # страницы показывают description_html, поэтому он загружается по обращению
+    description: Mapped[str] = mapped_column(Text, nullable=False, deferred=True)
+    description_html: Mapped[Optional[str]] = mapped_column(Text)
+    description_hash: Mapped[Optional[str]] = mapped_column(String(64))
     age_months: Mapped[int] = mapped_column(Integer, nullable=False)
     breed: Mapped[str] = mapped_column(String(100), nullable=False)
     gender: Mapped[str] = mapped_column(String(20), nullable=False)
@@ -116,9 +216,23 @@ class Animal(Base):
         nullable=False
     )
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    # Хранимый вычисляемый ранг статуса, чтобы сортировка каталога шла по индексу
+    status_rank: Mapped[int] = mapped_column(
+        Integer,
+        Computed(
+            'CASE status '
+            + ' '.join(f"WHEN '{status.name}' THEN {rank}" for status, rank in ANIMAL_STATUS_RANK.items())
+            + f' ELSE {len(ANIMAL_STATUS_RANK)} END',
+            persisted=True
+        )
+    )
+    # Денормализованные счётчики заявок, поддерживаются AdoptionRepository
+    adoption_count: Mapped[int] = mapped_column(Integer, default=0, server_default='0', nullable=False)
+    pending_count: Mapped[int] = mapped_column(Integer, default=0, server_default='0', nullable=False)
     
     images: Mapped[List["Image"]] = relationship(
         back_populates="animal", 
+        order_by=(Image.created_at, Image.id),
         cascade="all, delete-orphan",
         passive_deletes=True
     )
@@ -129,8 +243,45 @@ class Animal(Base):
         passive_deletes=True
     )
 
+    def set_description(self, text):
+        digest = content_hash(text)
+        if digest != self.description_hash or self.description_html is None:
+            self.description_html = render_markdown(text)
+            self.description_hash = digest
+        self.description = text
+
+Index(
+    'ix_animals_status_rank_created_at_id',
+    Animal.status_rank,
+    Animal.created_at.desc(),
+    Animal.id.desc()
+)
+
+# Полнотекстовый поиск (только MySQL, в SQLite используется таблица FTS5 из app.search)
+Index(
+    'ix_animals_fulltext',
+    Animal.name,
+    Animal.breed,
+    Animal.description,
+    mysql_prefix='FULLTEXT'
+).ddl_if(dialect='mysql')
+
+# Таблица FTS5 для поиска в SQLite, если база создаётся через db.create_all(),
+# а не миграциями. Запросы поиска DDL не выполняют
+event.listen(Animal.__table__, 'after_create', DDL(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS animals_fts "
+    "USING fts5(name, breed, description, tokenize = 'unicode61')"
+).execute_if(dialect='sqlite'))
+event.listen(Animal.__table__, 'before_drop', DDL(
+    'DROP TABLE IF EXISTS animals_fts'
+).execute_if(dialect='sqlite'))
+
 class Adoption(Base):
     __tablename__ = "adoptions"
+    __table_args__ = (
+        UniqueConstraint('user_id', 'animal_id'),
+        Index('ix_adoptions_animal_id_application_date', 'animal_id', 'application_date'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     application_date: Mapped[datetime] = mapped_column(default=datetime.now)
@@ -150,4 +301,15 @@ class Adoption(Base):
         nullable=False
     )
     animal: Mapped["Animal"] = relationship(back_populates="adoptions")
-    user: Mapped["User"] = relationship(back_populates="adoptions")
\ No newline at end of file
+    user: Mapped["User"] = relationship(back_populates="adoptions")
+class ImportProgress(Base):
+    """
+    Число сохранённых записей файла импорта. Обновляется в транзакции
+    каждого пакета, поэтому после сбоя совпадает с тем, что есть в базе
+    """
+    __tablename__ = "import_progress"
+
+    run_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    source: Mapped[str] = mapped_column(String(500), nullable=False)
+    records: Mapped[int] = mapped_column(Integer, default=0, server_default='0', nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(default=datetime.now, onupdate=datetime.now)
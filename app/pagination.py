@@ -0,0 +1,46 @@
+import base64
+import binascii
+import json
+
+
+def encode_cursor(values):
+    """Упаковать значения ключа сортировки последней строки в строку для URL"""
+    payload = json.dumps(list(values), separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, types=None):
+    """
+    Распаковать курсор, полученный из encode_cursor
+    :param types: Ожидаемые типы значений курсора по порядку (None - не проверять)
+    :raises ValueError: если курсор повреждён
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, UnicodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if not isinstance(values, list):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    if types is not None and (
+        len(values) != len(types)
+        # bool в JSON - подкласс int, но не id и не ранг
+        or not all(isinstance(value, expected) and not isinstance(value, bool)
+                   for value, expected in zip(values, types))
+    ):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return values
+
+
+class KeysetPage:
+    """Страница выборки с навигацией по курсору вместо OFFSET"""
+
+    is_keyset = True
+
+    def __init__(self, items, next_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
@@ -0,0 +1,115 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import lru_cache
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from .cache import LRUCache
+
+# Параметры по умолчанию, если PASSWORD_HASH_METHOD не задан в конфигурации
+DEFAULT_HASH_METHOD = 'scrypt:32768:8:1'
+
+class PasswordQueueFull(Exception):
+    """Все потоки проверки паролей заняты и очередь заполнена"""
+
+def init_passwords(app):
+    workers = app.config.get('PASSWORD_WORKERS', 0)
+    if workers:
+        app.extensions['password_executor'] = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='password-worker'
+        )
+        # Ограничение числа выполняемых и ожидающих проверок
+        app.extensions['password_slots'] = threading.BoundedSemaphore(
+            workers + app.config.get('PASSWORD_QUEUE_LIMIT', 0)
+        )
+    else:
+        app.extensions['password_executor'] = None
+
+    window = app.config.get('LOGIN_ATTEMPTS_WINDOW', 300)
+    app.extensions['login_throttles'] = {
+        'login': LoginThrottle(app.config.get('LOGIN_ATTEMPTS_PER_LOGIN', 5), window),
+        'ip': LoginThrottle(app.config.get('LOGIN_ATTEMPTS_PER_IP', 50), window),
+    }
+
+def hash_password(password):
+    """Хеш пароля с параметрами из PASSWORD_HASH_METHOD"""
+    return generate_password_hash(password, method=_hash_method())
+
+def needs_rehash(password_hash):
+    """Хеш посчитан с параметрами, отличными от текущих PASSWORD_HASH_METHOD"""
+    return password_hash.split('$', 1)[0] != _hash_prefix(_hash_method())
+
+def verify_password(password_hash, password):
+    """
+    Проверить пароль в пуле потоков PASSWORD_WORKERS, чтобы вычисление хешей
+    при всплеске входов не занимало все воркеры приложения
+    :raises PasswordQueueFull: если очередь проверок заполнена или проверка
+                               не уложилась в PASSWORD_VERIFY_TIMEOUT
+    """
+    return _run(check_password_hash, password_hash, password)
+
+def rehash_password(password):
+    """hash_password() в том же пуле потоков, что и проверка"""
+    return _run(generate_password_hash, password, _hash_method())
+
+def _run(func, *args):
+    app = current_app._get_current_object()
+    executor = app.extensions.get('password_executor')
+    if executor is None:
+        return func(*args)
+
+    slots = app.extensions['password_slots']
+    if not slots.acquire(blocking=False):
+        raise PasswordQueueFull()
+    future = executor.submit(func, *args)
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=app.config.get('PASSWORD_VERIFY_TIMEOUT'))
+    except TimeoutError as e:
+        raise PasswordQueueFull() from e
+
+def _hash_method():
+    return current_app.config.get('PASSWORD_HASH_METHOD') or DEFAULT_HASH_METHOD
+
+@lru_cache(maxsize=8)
+def _hash_prefix(method):
+    # werkzeug дописывает к краткой записи метода параметры по умолчанию
+    # ('scrypt' -> 'scrypt:32768:8:1'), поэтому префикс берётся из настоящего хеша
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+class LoginThrottle:
+    """
+    Ограничение числа попыток входа за окно времени (фиксированное окно)
+    :param limit: Максимальное число попыток за окно
+    :param window: Длина окна в секундах
+    """
+
+    def __init__(self, limit, window, maxsize=10000):
+        self.limit = limit
+        self.window = window
+        self._attempts = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        """Учесть попытку, вернуть False, если лимит для ключа исчерпан"""
+        if not self.limit:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            count, window_end = self._attempts.get(key) or (0, now + self.window)
+            if count >= self.limit:
+                return False
+            self._attempts.set(key, (count + 1, window_end), ttl=window_end - now)
+            return True
+
+    def blocked(self, key):
+        """Лимит для ключа исчерпан (попытка не учитывается)"""
+        if not self.limit:
+            return False
+        attempts = self._attempts.get(key)
+        return attempts is not None and attempts[0] >= self.limit
+
+    def reset(self, key):
+        self._attempts.delete(key)
@@ -0,0 +1,63 @@
+import hashlib
+import threading
+
+from markupsafe import Markup
+
+from .cache import LRUCache
+
+# Версия правил рендеринга входит в хеш: после изменения списка тегов
+# сохранённый HTML считается устаревшим и перерисовывается
+RENDER_VERSION = 1
+
+ALLOWED_TAGS = [
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'b', 'i', 'strong', 'em', 'tt',
+    'p', 'br', 'span', 'div', 'blockquote', 'code', 'hr',
+    'ul', 'ol', 'li', 'dd', 'dt', 'dl',
+    'img', 'a', 'sub', 'sup'
+]
+ALLOWED_ATTRIBUTES = {
+    'a': ['href', 'title'],
+    'img': ['src', 'alt', 'title']
+}
+
+_rendered_cache = LRUCache(maxsize=512)
+_renderers = threading.local()
+
+def content_hash(text):
+    """Хеш исходного markdown с учётом версии правил рендеринга"""
+    payload = f'{RENDER_VERSION}:{text}'.encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+def render_markdown(text):
+    """Преобразовать markdown в очищенный HTML"""
+    # Построение парсера Markdown и очистителя bleach дороже самого
+    # рендеринга короткого описания, поэтому они создаются один раз на поток
+    # (ни один из них не потокобезопасен)
+    renderers = getattr(_renderers, 'value', None)
+    if renderers is None:
+        # Библиотеки рендеринга импортируются при первом рендеринге: страницы
+        # обычно показывают уже сохранённый description_html
+        from bleach.sanitizer import Cleaner
+        from markdown import Markdown
+        renderers = _renderers.value = (
+            Markdown(),
+            Cleaner(tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES)
+        )
+    converter, cleaner = renderers
+    html = converter.reset().convert(text)
+    return cleaner.clean(html)
+
+def render_markdown_cached(text, digest=None):
+    """
+    Рендеринг с кэшем по хешу содержимого
+    :param text: Исходный markdown
+    :param digest: Заранее посчитанный content_hash(text), если известен
+    :return: Markup с очищенным HTML
+    """
+    digest = digest or content_hash(text)
+    html = _rendered_cache.get(digest)
+    if html is None:
+        html = render_markdown(text)
+        _rendered_cache.set(digest, html)
+    return Markup(html)
@@ -0,0 +1,125 @@
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Ключ bind реплики в SQLALCHEMY_BINDS
+REPLICA_BIND_KEY = 'replica'
+# Cookie, пока она есть, запросы клиента читают из основной базы
+PRIMARY_COOKIE = 'db_primary'
+# Параметры очереди QueuePool; StaticPool, который Flask-SQLAlchemy выбирает
+# для SQLite в памяти, их не принимает
+QUEUE_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+class RoutingSession(Session):
+    """
+    Сессия, которая отправляет SELECT из методов с @read_only на реплику.
+    Остальные запросы, запись и чтение сразу после собственной записи
+    (read-your-writes) идут в основную базу
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and self.info.get('read_only') and not self._flushing
+                and getattr(clause, 'is_select', False) and self._replica_allowed()):
+            replica = self._db.engines.get(REPLICA_BIND_KEY)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica_allowed(self):
+        if self.info.get('primary_until', 0) > time.monotonic():
+            return False
+        if has_request_context() and g.get('db_primary'):
+            return False
+        return True
+
+@contextmanager
+def replica_reads(session):
+    """Разрешить чтение с реплики внутри блока"""
+    session.info['read_only'] = session.info.get('read_only', 0) + 1
+    try:
+        yield
+    finally:
+        session.info['read_only'] -= 1
+
+def read_only(method):
+    """Метод репозитория только читает данные и может читать с реплики"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with replica_reads(self.db.session):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_flush_write(session, flush_context):
+    session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_statement_write(orm_execute_state):
+    if (orm_execute_state.is_insert or orm_execute_state.is_update
+            or orm_execute_state.is_delete):
+        orm_execute_state.session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(session):
+    # Освобождение точки сохранения - ещё не commit
+    if session.in_nested_transaction():
+        return
+    if not session.info.pop('wrote', False) or not has_app_context():
+        return
+    seconds = current_app.config.get('REPLICA_STICKY_SECONDS', 5)
+    session.info['primary_until'] = time.monotonic() + seconds
+    if has_request_context():
+        g.db_primary = g.db_primary_cookie = True
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_rolled_back_write(session):
+    session.info.pop('wrote', None)
+
+def engine_options(uri, options):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS для базы uri: для SQLite в памяти (sqlite://,
+    :memory:) без параметров очереди пула
+    """
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return {key: value for key, value in options.items() if key not in QUEUE_POOL_OPTIONS}
+    return dict(options)
+
+def init_replicas(app):
+    """
+    Настроить пулы соединений и подключить реплику SQLALCHEMY_REPLICA_URI как
+    bind 'replica'. Вызывается до db.init_app(), чтобы Flask-SQLAlchemy
+    создал engine с этими параметрами
+    """
+    options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+    primary_uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+    if primary_uri:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(primary_uri, options)
+
+    replica_uri = app.config.get('SQLALCHEMY_REPLICA_URI')
+    if not replica_uri:
+        return
+    # Параметры engine для bind задаются в самом SQLALCHEMY_BINDS
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds.setdefault(REPLICA_BIND_KEY, {'url': replica_uri, **engine_options(replica_uri, options)})
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+    @app.before_request
+    def read_primary_after_write():
+        g.db_primary = PRIMARY_COOKIE in request.cookies
+
+    @app.after_request
+    def set_primary_cookie(response):
+        if g.get('db_primary_cookie'):
+            response.set_cookie(
+                PRIMARY_COOKIE, '1',
+                max_age=app.config.get('REPLICA_STICKY_SECONDS', 5),
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
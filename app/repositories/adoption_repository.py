@@ -1,7 +1,25 @@
-from ..models import AdoptionStatus, Adoption
+from ..models import AdoptionStatus, Adoption, Animal, AnimalStatus, User
+from sqlalchemy import func, case, and_, or_
+from sqlalchemy.exc import IntegrityError
 
 from datetime import datetime
 
+from ..cache import catalog_cache
+from ..pagination import KeysetPage, decode_cursor, encode_cursor
+from ..unit_of_work import on_commit
+
+class AdoptionError(ValueError):
+    """Заявку нельзя подать"""
+
+class AnimalNotFound(AdoptionError):
+    pass
+
+class AnimalNotAvailable(AdoptionError):
+    pass
+
+class DuplicateAdoption(AdoptionError):
+    pass
+
 class AdoptionRepository:
     def __init__(self, db):
         self.db = db
@@ -22,10 +40,71 @@ class AdoptionRepository:
             .order_by(Adoption.application_date.desc())
         ).scalars()
 
+    def get_animal_adoptions_page(self, animal_id, cursor=None, per_page=20):
+        """
+        Страница заявок на животное для таблицы модератора: только нужные
+        столбцы и ФИО пользователя одним запросом, навигация по курсору
+        (application_date, id)
+        :param animal_id: ID животного
+        :param cursor: Курсор последней строки предыдущей страницы или None
+        :param per_page: Количество заявок на странице
+        :return: KeysetPage со строками (id, application_date, contact_info,
+                 status, last_name, first_name)
+        :raises ValueError: если курсор повреждён
+        """
+        query = (
+            self.db.select(
+                Adoption.id,
+                Adoption.application_date,
+                Adoption.contact_info,
+                Adoption.status,
+                User.last_name,
+                User.first_name
+            )
+            .join(User, Adoption.user_id == User.id)
+            .where(Adoption.animal_id == animal_id)
+            .order_by(Adoption.application_date.desc(), Adoption.id.desc())
+        )
+        if cursor:
+            try:
+                last_date, last_id = decode_cursor(cursor, (str, int))
+                last_date = datetime.fromisoformat(last_date)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid cursor: {cursor!r}") from e
+            query = query.where(or_(
+                Adoption.application_date < last_date,
+                and_(Adoption.application_date == last_date, Adoption.id < last_id)
+            ))
+
+        rows = self.db.session.execute(query.limit(per_page + 1)).all()
+        next_cursor = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            next_cursor = encode_cursor((rows[-1].application_date.isoformat(), rows[-1].id))
+        return KeysetPage(rows, next_cursor=next_cursor)
+
     def has_user_adoption(self, user_id, animal_id):
         return self.get_user_adoption(user_id, animal_id) is not None
 
-    def create_adoption(self, user_id, animal_id, contact_info):
+    def submit(self, user_id, animal_id, contact_info):
+        """
+        Подать заявку в транзакции запроса: строка животного блокируется
+        (SELECT ... FOR UPDATE), повторную заявку отсекает уникальный ключ
+        (user_id, animal_id), статус и счётчики меняются одним UPDATE.
+        После исключения вызывающий код должен откатить транзакцию
+        :return: Объект Adoption
+        :raises AnimalNotFound: если животного нет
+        :raises AnimalNotAvailable: если животное уже усыновлено
+        :raises DuplicateAdoption: если пользователь уже подавал заявку
+        """
+        animal = self.db.session.execute(
+            self.db.select(Animal).filter_by(id=animal_id).with_for_update()
+        ).scalar()
+        if animal is None:
+            raise AnimalNotFound(f"Animal {animal_id} not found")
+        if animal.status not in (AnimalStatus.AVAILABLE, AnimalStatus.ADOPTION):
+            raise AnimalNotAvailable(f"Animal {animal_id} is not available for adoption")
+
         adoption = Adoption(
             user_id=user_id,
             animal_id=animal_id,
@@ -33,8 +112,21 @@ class AdoptionRepository:
             status=AdoptionStatus.PENDING,
             application_date=datetime.now()
         )
-        self.db.session.add(adoption)
-        self.db.session.commit()
+        try:
+            self.db.session.add(adoption)
+            self.db.session.flush()
+        except IntegrityError as e:
+            raise DuplicateAdoption(
+                f"User {user_id} already applied for animal {animal_id}"
+            ) from e
+
+        self._update_counters(
+            animal_id,
+            status=AnimalStatus.ADOPTION,
+            adoption_count=Animal.adoption_count + 1,
+            pending_count=Animal.pending_count + 1
+        )
+        on_commit(self.db.session, catalog_cache.bump)
         return adoption
 
     def accept_adoption(self, adoption_id):
@@ -50,10 +142,159 @@ class AdoptionRepository:
                 )
                 .values(status=AdoptionStatus.REJECTED_ADOPTED)
             )
-            self.db.session.commit()
+            # После принятия заявки на животное не остаётся ожидающих
+            self._update_counters(adoption.animal_id, pending_count=0)
+            on_commit(self.db.session, catalog_cache.bump)
 
     def reject_adoption(self, adoption_id):
         adoption = self.get_adoption(adoption_id)
         if adoption:
+            if adoption.status == AdoptionStatus.PENDING:
+                self._update_counters(
+                    adoption.animal_id,
+                    pending_count=Animal.pending_count - 1
+                )
             adoption.status = AdoptionStatus.REJECTED
-            self.db.session.commit()
\ No newline at end of file
+            on_commit(self.db.session, catalog_cache.bump)
+
+    def process_many(self, adoption_ids, action):
+        """
+        Принять или отклонить несколько заявок в транзакции запроса. Как и в
+        accept_adoption, принятие заявки отклоняет остальные ожидающие заявки
+        на то же животное; из нескольких принимаемых заявок на одно животное
+        принимается первая в списке
+        :param adoption_ids: ID заявок
+        :param action: 'accept' или 'reject'
+        :return: Словарь ID заявки -> итоговый статус (значение AdoptionStatus),
+                 'not_found' или 'not_pending'
+        :raises ValueError: если действие неизвестно
+        """
+        if action not in ('accept', 'reject'):
+            raise ValueError(f"Unknown action: {action}")
+
+        adoption_ids = list(dict.fromkeys(adoption_ids))
+        rows = self.db.session.execute(
+            self.db.select(Adoption.id, Adoption.animal_id, Adoption.status)
+            .where(Adoption.id.in_(adoption_ids))
+            .with_for_update()
+        ).all()
+        found = {row.id: row for row in rows}
+
+        results = {}
+        pending = []
+        for adoption_id in adoption_ids:
+            row = found.get(adoption_id)
+            if row is None:
+                results[adoption_id] = 'not_found'
+            elif row.status != AdoptionStatus.PENDING:
+                results[adoption_id] = 'not_pending'
+            else:
+                pending.append(row)
+
+        if pending and action == 'reject':
+            self._set_status([row.id for row in pending], AdoptionStatus.REJECTED)
+            animal_ids = {row.animal_id for row in pending}
+            pending_left = (
+                self.db.select(func.count(Adoption.id))
+                .where(Adoption.animal_id == Animal.id, Adoption.status == AdoptionStatus.PENDING)
+                .scalar_subquery()
+            )
+            self.db.session.execute(
+                self.db.update(Animal)
+                .where(Animal.id.in_(animal_ids))
+                .values(pending_count=pending_left)
+            )
+            results.update((row.id, AdoptionStatus.REJECTED.value) for row in pending)
+        elif pending:
+            accepted = {}
+            for row in pending:
+                accepted.setdefault(row.animal_id, row.id)
+            self._set_status(list(accepted.values()), AdoptionStatus.ACCEPTED)
+            self.db.session.execute(
+                self.db.update(Adoption)
+                .where(
+                    Adoption.animal_id.in_(accepted),
+                    Adoption.status == AdoptionStatus.PENDING
+                )
+                .values(status=AdoptionStatus.REJECTED_ADOPTED)
+            )
+            self.db.session.execute(
+                self.db.update(Animal)
+                .where(Animal.id.in_(accepted))
+                .values(pending_count=0)
+            )
+            for row in pending:
+                status = (AdoptionStatus.ACCEPTED if accepted[row.animal_id] == row.id
+                          else AdoptionStatus.REJECTED_ADOPTED)
+                results[row.id] = status.value
+
+        if pending:
+            on_commit(self.db.session, catalog_cache.bump)
+        return results
+
+    def _set_status(self, adoption_ids, status):
+        self.db.session.execute(
+            self.db.update(Adoption)
+            .where(Adoption.id.in_(adoption_ids))
+            .values(status=status)
+        )
+
+    def _update_counters(self, animal_id, **values):
+        """Изменить счётчики заявок животного в текущей транзакции"""
+        self.db.session.execute(
+            self.db.update(Animal)
+            .where(Animal.id == animal_id)
+            .values(**values)
+        )
+
+    def _actual_counts(self):
+        return (
+            self.db.select(
+                Adoption.animal_id,
+                func.count(Adoption.id).label('adoption_count'),
+                func.sum(
+                    case((Adoption.status == AdoptionStatus.PENDING, 1), else_=0)
+                ).label('pending_count')
+            )
+            .group_by(Adoption.animal_id)
+            .subquery()
+        )
+
+    def verify_counters(self):
+        """
+        Сверить денормализованные счётчики с таблицей adoptions
+        :return: Список (animal_id, (adoption_count, pending_count) сохранённые,
+                 (adoption_count, pending_count) фактические) для расхождений
+        """
+        actual = self._actual_counts()
+        actual_total = func.coalesce(actual.c.adoption_count, 0)
+        actual_pending = func.coalesce(actual.c.pending_count, 0)
+        rows = self.db.session.execute(
+            self.db.select(
+                Animal.id,
+                Animal.adoption_count,
+                Animal.pending_count,
+                actual_total,
+                actual_pending
+            )
+            .outerjoin(actual, Animal.id == actual.c.animal_id)
+            .where(
+                (Animal.adoption_count != actual_total)
+                | (Animal.pending_count != actual_pending)
+            )
+            .order_by(Animal.id)
+        ).all()
+        return [(row[0], (row[1], row[2]), (row[3], row[4])) for row in rows]
+
+    def repair_counters(self):
+        """Пересчитать счётчики всех животных в текущей транзакции, вернуть число исправленных"""
+        mismatches = self.verify_counters()
+        for animal_id, _, (adoption_count, pending_count) in mismatches:
+            self._update_counters(
+                animal_id,
+                adoption_count=adoption_count,
+                pending_count=pending_count
+            )
+        if mismatches:
+            on_commit(self.db.session, catalog_cache.bump)
+        return len(mismatches)
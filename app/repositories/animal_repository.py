@@ -1,86 +1,269 @@
+from collections import namedtuple
 from datetime import datetime
 import os
 from flask import current_app
-from ..models import Animal, Adoption, AnimalStatus
-from sqlalchemy import func, desc, case
+from ..models import Animal, AnimalStatus, Image, ImageState
+from sqlalchemy import func, desc, and_, or_
+
+from ..cache import LRUCache, catalog_cache
+from ..replicas import read_only
+from ..unit_of_work import on_commit
+from ..derivatives import remove_derivatives
+from .blob_repository import BlobRepository
+from .image_repository import ImageRepository
+from ..pagination import KeysetPage, decode_cursor, encode_cursor
+from .. import search
+
+_count_cache = LRUCache(maxsize=1)
+
+# Строка каталога: только то, что показывает карточка, и ключ сортировки для
+# курсора. Описание и прочие столбцы Animal не выбираются
+AnimalCard = namedtuple('AnimalCard', [
+    'id', 'name', 'breed', 'age_months', 'gender', 'status', 'adoption_count',
+    'status_rank', 'created_at', 'cover_image_id'
+])
 
 class AnimalRepository:
     def __init__(self, db):
         self.db = db
+        self.blob_repository = BlobRepository(db)
+        self.image_repository = ImageRepository(db)
 
     def get_all_animals(self):
         return self.db.session.execute(self.db.select(Animal)).scalars()
     
+    @read_only
     def get_animal_by_id(self, animal_id):
         return self.db.session.execute(self.db.select(Animal).filter_by(id=animal_id)).scalar()
     
-    def get_paginated_animals_sorted(self, page=1, per_page=10):
-        adoption_counts = (
-            self.db.session.query(
-                Adoption.animal_id,
-                func.count(Adoption.id).label('adoption_count')
-            )
-            .group_by(Adoption.animal_id)
-            .subquery()
-        )
-
-        status_order = case(
-            (Animal.status == AnimalStatus.AVAILABLE, 0),
-            (Animal.status == AnimalStatus.ADOPTION, 1),
-            (Animal.status == AnimalStatus.ADOPTED, 2),
-            else_=3
+    def _listing_query(self):
+        # Выбираются только столбцы карточки, без сущностей Animal в identity
+        # map. Обложка выбирается коррелированным подзапросом в том же SELECT,
+        # чтобы шаблон не подгружал animal.images для каждой строки. Порядок тот
+        # же, что у Animal.images: обложка совпадает с первым фото на странице
+        cover_image_id = (
+            self.db.select(Image.id)
+            .where(Image.animal_id == Animal.id, Image.processing_state == ImageState.READY)
+            .order_by(Image.created_at, Image.id)
+            .limit(1)
+            .correlate(Animal)
+            .scalar_subquery()
         )
         
-        query = (
+        return (
             self.db.session.query(
-                Animal,
-                func.coalesce(adoption_counts.c.adoption_count, 0).label('adoption_count')
+                Animal.id,
+                Animal.name,
+                Animal.breed,
+                Animal.age_months,
+                Animal.gender,
+                Animal.status,
+                Animal.adoption_count,
+                Animal.status_rank,
+                Animal.created_at,
+                cover_image_id.label('cover_image_id')
             )
-            .outerjoin(adoption_counts, Animal.id == adoption_counts.c.animal_id)
             .order_by(
-                status_order,
-                desc(Animal.created_at)
+                Animal.status_rank,
+                desc(Animal.created_at),
+                desc(Animal.id)
             )
-            .paginate(page=page, per_page=per_page, error_out=False)
         )
-        
-        return query
+
+    def _paginate_cards(self, query, page, per_page):
+        """Страница query с элементами AnimalCard"""
+        animals_page = query.paginate(page=page, per_page=per_page, error_out=False)
+        animals_page.items = [AnimalCard(*row) for row in animals_page.items]
+        return animals_page
+
+    @read_only
+    def get_paginated_animals_sorted(self, page=1, per_page=10):
+        """Страница каталога с элементами AnimalCard"""
+        return self._paginate_cards(self._listing_query(), page, per_page)
+
+    @read_only
+    def get_animals_after(self, cursor=None, per_page=10):
+        """
+        Страница каталога с навигацией по курсору (keyset pagination)
+        :param cursor: Курсор последней строки предыдущей страницы или None
+        :param per_page: Количество животных на странице
+        :return: KeysetPage с элементами AnimalCard
+        :raises ValueError: если курсор повреждён
+        """
+        query = self._listing_query()
+        if cursor:
+            try:
+                last_rank, last_created_at, last_id = decode_cursor(cursor, (int, str, int))
+                last_created_at = datetime.fromisoformat(last_created_at)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid cursor: {cursor!r}") from e
+            query = query.filter(or_(
+                Animal.status_rank > last_rank,
+                and_(Animal.status_rank == last_rank, Animal.created_at < last_created_at),
+                and_(
+                    Animal.status_rank == last_rank,
+                    Animal.created_at == last_created_at,
+                    Animal.id < last_id
+                )
+            ))
+
+        rows = [AnimalCard(*row) for row in query.limit(per_page + 1)]
+        next_cursor = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            last = rows[-1]
+            next_cursor = encode_cursor(
+                (last.status_rank, last.created_at.isoformat(), last.id)
+            )
+
+        return KeysetPage(rows, next_cursor=next_cursor, total=self.count_animals_cached())
+
+    def _search_filters(self, query=None, gender=None, status=None, age=None):
+        """Условия поиска по ключам 'query', 'gender', 'status', 'age'"""
+        filters = {}
+        match = search.match_clause(self.db.session, query)
+        if match is not None:
+            filters['query'] = match
+        if gender:
+            filters['gender'] = Animal.gender == gender
+        if status:
+            filters['status'] = Animal.status == status
+        if age:
+            age_clause = search.age_range_clause(age)
+            if age_clause is not None:
+                filters['age'] = age_clause
+        return filters
+
+    def search_animals(self, query=None, gender=None, status=None, age=None, page=1, per_page=10):
+        """
+        Поиск животных по тексту (имя, порода, описание) с фильтрами. Порядок
+        тот же, что и в каталоге
+        :param query: Строка поиска
+        :param gender: Пол
+        :param status: AnimalStatus
+        :param age: Ключ диапазона из search.AGE_RANGES
+        :return: Страница AnimalCard, как get_paginated_animals_sorted
+        """
+        filters = self._search_filters(query, gender, status, age)
+        return self._paginate_cards(
+            self._listing_query().filter(*filters.values()), page, per_page
+        )
+
+    def search_facets(self, query=None, gender=None, status=None, age=None):
+        """
+        Количество найденных животных по каждому значению пола, статуса и
+        диапазона возраста. Все счётчики считаются одним запросом с группировкой;
+        счётчик значения учитывает остальные выбранные фильтры, но не свой
+        :return: Словарь 'gender' / 'status' / 'age' -> {значение: количество}
+        """
+        filters = self._search_filters(query)
+        age_range = search.age_range_column().label('age_range')
+        rows = self.db.session.execute(
+            self.db.select(Animal.gender, Animal.status, age_range, func.count(Animal.id))
+            .filter(*filters.values())
+            .group_by(Animal.gender, Animal.status, age_range)
+        ).all()
+
+        selected = {'gender': gender, 'status': status, 'age': age}
+        facets = {name: {} for name in selected}
+        for row_gender, row_status, row_age, count in rows:
+            values = {'gender': row_gender, 'status': row_status, 'age': row_age}
+            for name in facets:
+                if all(
+                    not selected[other] or values[other] == selected[other]
+                    for other in selected if other != name
+                ):
+                    facets[name][values[name]] = facets[name].get(values[name], 0) + count
+        return facets
+
+    def rebuild_search_index(self):
+        """Перестроить индекс поиска, вернуть число животных (None для MySQL)"""
+        return search.rebuild_index(self.db.session)
+
+    def count_animals_cached(self):
+        """Приблизительное число животных: COUNT(*) кэшируется на ANIMALS_COUNT_CACHE_TTL секунд"""
+        ttl = current_app.config.get('ANIMALS_COUNT_CACHE_TTL', 60)
+        if not ttl:
+            return None
+        total = _count_cache.get('animals')
+        if total is None:
+            total = self.db.session.execute(
+                self.db.select(func.count(Animal.id))
+            ).scalar()
+            _count_cache.set('animals', total, ttl=ttl)
+        return total
     
     def create_animal(self, name, description, age_months, breed, gender, status):
         animal = Animal(
             name=name,
-            description=description,
             age_months=age_months,
             breed=breed,
             gender=gender,
             status=status,
             created_at=datetime.now()
         )
+        animal.set_description(description)
         self.db.session.add(animal)
-        self.db.session.commit()
+        self.db.session.flush()
+        search.index_animal(self.db.session, animal)
+        on_commit(self.db.session, catalog_cache.bump)
         return animal
 
     def update_animal(self, animal, **kwargs):
+        if 'description' in kwargs:
+            animal.set_description(kwargs.pop('description'))
         for key, value in kwargs.items():
             setattr(animal, key, value)
-        self.db.session.commit()
+        search.index_animal(self.db.session, animal)
+        on_commit(self.db.session, catalog_cache.bump)
 
     def update_animal_status(self, animal_id, status):
         animal = self.get_animal_by_id(animal_id)
         if animal:
             animal.status = status
-            self.db.session.commit()
+            on_commit(self.db.session, catalog_cache.bump)
 
     def delete_animal(self, animal_id):
         animal = self.get_animal_by_id(animal_id)
         if animal:
-            for image in animal.images:
-                try:
-                    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], image.storage_filename)
-                    if os.path.exists(filepath):
-                        os.remove(filepath)
-                except Exception as e:
-                    current_app.logger.error(f"Error deleting image file: {e}")
-            
+            image_ids = [image.id for image in animal.images]
+            blob_hashes = [image.blob_hash for image in animal.images if image.blob_hash]
+            legacy_files = [image.storage_filename for image in animal.images if not image.blob_hash]
+            legacy_files += [image.incoming_filename for image in animal.images if not image.blob_hash]
+
             self.db.session.delete(animal)
-            self.db.session.commit()
\ No newline at end of file
+            search.remove_animal(self.db.session, animal_id)
+            self.db.session.flush()
+            # Файл удаляется, только когда на него не осталось ссылок
+            unused_blobs = [
+                (blob_hash, path)
+                for blob_hash, path in zip(blob_hashes, map(self.blob_repository.release, blob_hashes))
+                if path
+            ]
+            legacy_paths = [
+                os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+                for filename in legacy_files
+            ]
+
+            # Файлы и кэши трогаются только после commit(): при откате
+            # животное и его изображения остаются на месте
+            def cleanup():
+                for image_id in image_ids:
+                    self.image_repository.invalidate_image_info(image_id)
+                for blob_hash, filepath in unused_blobs:
+                    try:
+                        # Файл остаётся, если параллельный acquire() успел
+                        # снова сослаться на то же содержимое
+                        self.blob_repository.discard_created_file(blob_hash, filepath)
+                    except Exception as e:
+                        current_app.logger.error(f"Error deleting image file: {e}")
+                for filepath in legacy_paths:
+                    try:
+                        if os.path.exists(filepath):
+                            os.remove(filepath)
+                        remove_derivatives(filepath)
+                    except Exception as e:
+                        current_app.logger.error(f"Error deleting image file: {e}")
+
+            on_commit(self.db.session, cleanup)
+            on_commit(self.db.session, catalog_cache.bump)
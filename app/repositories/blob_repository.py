@@ -0,0 +1,103 @@
+import os
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from ..derivatives import remove_derivatives
+from ..models import Blob
+
+class BlobRepository:
+    def __init__(self, db):
+        self.db = db
+
+    def get(self, blob_hash):
+        return self.db.session.get(Blob, blob_hash)
+
+    def file_path(self, blob_hash):
+        """Абсолютный путь к файлу blob в UPLOAD_FOLDER"""
+        return os.path.join(current_app.config['UPLOAD_FOLDER'], Blob.path_for(blob_hash))
+
+    def acquire(self, tmp_path, blob_hash, size, mime_type):
+        """
+        Добавить ссылку на содержимое, сохранив файл, если его ещё нет
+        :param tmp_path: Временный файл с содержимым (будет перемещён или удалён)
+        :param blob_hash: SHA-256 содержимого
+        :param size: Размер в байтах
+        :param mime_type: MIME тип
+        :return: Путь к созданному файлу, если он появился только что, иначе None
+        """
+        file_path = self.file_path(blob_hash)
+        while True:
+            # UPDATE блокирует строку до конца транзакции, поэтому параллельный
+            # release() уже не удалит запись
+            updated = self.db.session.execute(
+                self.db.update(Blob)
+                .where(Blob.hash == blob_hash)
+                .values(refcount=Blob.refcount + 1)
+            ).rowcount
+            if updated == 1:
+                break
+            # Записи нет: содержимое новое или release() только что убрал
+            # последнюю ссылку и удалит файл после commit(), поэтому файл
+            # записывается заново
+            try:
+                with self.db.session.begin_nested():
+                    self.db.session.add(Blob(
+                        hash=blob_hash,
+                        size=size,
+                        mime_type=mime_type,
+                        refcount=1
+                    ))
+            except IntegrityError:
+                # Такой же файл параллельно добавил другой запрос
+                continue
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            os.replace(tmp_path, file_path)
+            return file_path
+
+        if os.path.exists(file_path):
+            os.remove(tmp_path)
+            return None
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        os.replace(tmp_path, file_path)
+        return file_path
+
+    def release(self, blob_hash):
+        """
+        Убрать ссылку на содержимое. Запись blob без ссылок удаляется в текущей
+        транзакции, а файл нужно удалить после commit() через
+        discard_created_file(): если acquire() параллельного запроса успел
+        вернуть запись, файл остаётся
+        :return: Путь к файлу, который больше не нужен, иначе None
+        """
+        self.db.session.execute(
+            self.db.update(Blob)
+            .where(Blob.hash == blob_hash)
+            .values(refcount=Blob.refcount - 1)
+        )
+        deleted = self.db.session.execute(
+            self.db.delete(Blob)
+            .where(Blob.hash == blob_hash, Blob.refcount <= 0)
+        ).rowcount
+        return self.file_path(blob_hash) if deleted else None
+
+    def discard_created_file(self, blob_hash, created_path):
+        """
+        Удалить файл, созданный acquire(), после отката транзакции или файл,
+        освобождённый release(), после commit(). Проверка записи и удаление
+        файла выполняются в отдельной транзакции под блокировкой записи blob
+        (в InnoDB SELECT ... FOR UPDATE блокирует и отсутствующий ключ),
+        поэтому параллельный acquire() не вернёт запись между ними. Если
+        запись есть, файл принадлежит ей и остаётся. Можно вызывать из on_commit
+        :return: True, если файл удалён
+        """
+        if created_path is None:
+            return False
+        with self.db.engine.begin() as connection:
+            referenced = connection.execute(
+                self.db.select(Blob.hash).where(Blob.hash == blob_hash).with_for_update()
+            ).first()
+            if referenced is not None:
+                return False
+            if os.path.exists(created_path):
+                os.remove(created_path)
+            remove_derivatives(created_path)
+        return True
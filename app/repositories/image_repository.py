@@ -1,70 +1,269 @@
 import hashlib
+from collections import namedtuple
+import shutil
+import tempfile
 import uuid
 import os
 from werkzeug.utils import secure_filename
 from flask import current_app
-from ..models import Image
+from sqlalchemy.exc import IntegrityError
+from ..models import Image, ImageState
+from .blob_repository import BlobRepository
+from ..derivatives import detect_mime_type, generate_derivatives, mime_type_for, strip_metadata
+from ..cache import LRUCache, SqliteCache, catalog_cache
+from ..replicas import read_only
+from ..unit_of_work import on_rollback, savepoint
+
+# Размер блока при потоковом чтении загружаемых файлов
+CHUNK_SIZE = 64 * 1024
+
+# Всё, что нужно для отдачи файла изображения без запроса к базе
+ImageInfo = namedtuple('ImageInfo', ['storage_filename', 'mime_type', 'content_hash'])
+
+image_info_cache = LRUCache(maxsize=4096)
 
 class ImageRepository:
     def __init__(self, db):
         self.db = db
+        self.blob_repository = BlobRepository(db)
 
+    @read_only
     def get_by_id(self, image_id):
         return self.db.session.get(Image, image_id)
 
+    def get_image_info(self, image_id):
+        """
+        Данные для отдачи готового изображения. Сначала проверяется кэш процесса,
+        затем общий кэш IMAGE_INFO_CACHE_PATH и только потом база
+        :return: ImageInfo или None, если изображения нет или оно не обработано
+        """
+        info = image_info_cache.get(image_id)
+        if info is not None:
+            return info
+
+        shared_cache = self._shared_cache()
+        if shared_cache is not None:
+            cached = shared_cache.get(image_id)
+            if cached is not None:
+                info = ImageInfo(*cached)
+                image_info_cache.set(image_id, info)
+                return info
+
+        image = self.get_by_id(image_id)
+        if not image or not image.is_ready:
+            return None
+        info = ImageInfo(image.storage_filename, image.mime_type, image.content_hash)
+        image_info_cache.set(image_id, info)
+        if shared_cache is not None:
+            shared_cache.set(image_id, list(info))
+        return info
+
+    def invalidate_image_info(self, image_id):
+        image_info_cache.delete(image_id)
+        shared_cache = self._shared_cache()
+        if shared_cache is not None:
+            shared_cache.delete(image_id)
+
+    def _shared_cache(self):
+        path = current_app.config.get('IMAGE_INFO_CACHE_PATH')
+        return SqliteCache.for_path(path) if path else None
+
     def add_image(self, file, animal_id=None):
         """
-        Добавить новое изображение
+        Добавить новое изображение. Файл только сохраняется во входящую папку,
+        хеширование и остальная обработка выполняются process_image в фоне.
+        Запись добавляется в точке сохранения транзакции запроса: ошибка
+        отменяет только это изображение, а файл удаляется и при откате
+        всей транзакции
         :param file: Файл изображения
         :param animal_id: ID животного (обязательно для сохранения)
-        :return: Объект Image
+        :return: Объект Image в состоянии PENDING
         """
         if animal_id is None:
             raise ValueError("animal_id is required for image")
+        # Предварительный тип по расширению, process_image уточнит его по содержимому
+        mime_type = mime_type_for(file.filename or '')
+        if mime_type is None:
+            raise ValueError(f"Unsupported image type: {file.filename!r}")
 
-        # Проверяем, есть ли уже такое изображение
-        existing_image = self._find_by_md5_hash(file)
-        if existing_image:
-            return existing_image
-
-        # Создаем новое изображение
-        file_name = secure_filename(file.filename)
-        md5_hash = self._calculate_md5(file)
-        
         image = Image(
             id=str(uuid.uuid4()),
-            file_name=file_name,
-            mime_type=file.mimetype,
-            md5_hash=md5_hash,
+            file_name=secure_filename(file.filename),
+            mime_type=mime_type,
+            processing_state=ImageState.PENDING,
             animal_id=animal_id  # Устанавливаем animal_id сразу
         )
 
-        # Сохраняем файл на диск
-        self._save_file(file, image)
-        
-        # Добавляем в БД
-        self.db.session.add(image)
+        incoming_path = self._incoming_path(image)
+        self._stream_to_file(file.stream, incoming_path)
+        with savepoint(self.db.session):
+            on_rollback(self.db.session, lambda: os.remove(incoming_path))
+            self.db.session.add(image)
+            self.db.session.flush()
+
+        return image
+
+    def get_pending_image_ids(self, include_stuck=False):
+        """ID изображений, ожидающих обработки"""
+        states = [ImageState.PENDING]
+        if include_stuck:
+            states.append(ImageState.PROCESSING)
+        return self.db.session.execute(
+            self.db.select(Image.id)
+            .filter(Image.processing_state.in_(states))
+        ).scalars().all()
+
+    def process_image(self, image_id, include_stuck=False):
+        """
+        Обработать загруженный файл: удалить метаданные, посчитать хеш,
+        поместить в хранилище blobs и подготовить уменьшенные копии
+        :param image_id: ID изображения
+        :param include_stuck: Забрать и изображение, обработка которого была прервана
+        :return: Объект Image или None, если изображение удалено или является дубликатом
+        """
+        states = [ImageState.PENDING]
+        if include_stuck:
+            states.append(ImageState.PROCESSING)
+        # Захват записи, чтобы одно изображение не обработали два воркера
+        claimed = self.db.session.execute(
+            self.db.update(Image)
+            .where(Image.id == image_id, Image.processing_state.in_(states))
+            .values(processing_state=ImageState.PROCESSING)
+        ).rowcount
         self.db.session.commit()
-        
+        image = self.get_by_id(image_id)
+        if not claimed or image is None:
+            return image
+
+        incoming_path = self._incoming_path(image)
+        blob_hash = created_path = None
+        try:
+            image.mime_type = detect_mime_type(incoming_path, image.file_name)
+            strip_metadata(incoming_path, image.mime_type)
+            blob_hash, size = self._hash_file(incoming_path)
+
+            # Повторная загрузка того же файла для этого животного
+            if self._find_by_blob_hash(blob_hash, image.animal_id):
+                os.remove(incoming_path)
+                return self._delete_duplicate(image_id)
+
+            # Одинаковые файлы разных животных хранятся на диске один раз
+            created_path = self.blob_repository.acquire(incoming_path, blob_hash, size, image.mime_type)
+            image.blob_hash = blob_hash
+            image.processing_state = ImageState.READY
+            self.db.session.commit()
+            # Обложка карточки выбирается только из готовых изображений
+            catalog_cache.bump()
+        except IntegrityError:
+            # Такой же файл этого животного параллельно обработал другой воркер
+            self.db.session.rollback()
+            self.blob_repository.discard_created_file(blob_hash, created_path)
+            return self._delete_duplicate(image_id)
+        except Exception:
+            self.db.session.rollback()
+            if blob_hash is not None:
+                self.blob_repository.discard_created_file(blob_hash, created_path)
+            self._mark_failed(image_id)
+            raise
+
+        if current_app.config.get('IMAGE_DERIVATIVES_ON_UPLOAD'):
+            generate_derivatives(image.storage_filename, image.mime_type)
         return image
 
-    def _find_by_md5_hash(self, file):
-        """Найти существующее изображение по хешу"""
-        md5_hash = self._calculate_md5(file)
+    def _delete_duplicate(self, image_id):
+        self.invalidate_image_info(image_id)
+        image = self.get_by_id(image_id)
+        if image is not None:
+            self.db.session.delete(image)
+            self.db.session.commit()
+        return None
+
+    def _mark_failed(self, image_id):
+        self.db.session.execute(
+            self.db.update(Image)
+            .where(Image.id == image_id)
+            .values(processing_state=ImageState.FAILED)
+        )
+        self.db.session.commit()
+
+    def _find_by_blob_hash(self, blob_hash, animal_id):
+        """Найти изображение животного с таким же содержимым"""
         return self.db.session.execute(
-            self.db.select(Image).filter(Image.md5_hash == md5_hash)
+            self.db.select(Image).filter_by(blob_hash=blob_hash, animal_id=animal_id)
         ).scalar()
 
-    def _calculate_md5(self, file):
-        """Вычислить MD5 хеш файла"""
-        file.seek(0)
-        md5_hash = hashlib.md5(file.read()).hexdigest()
-        file.seek(0)
-        return md5_hash
-
-    def _save_file(self, file, image):
-        """Сохранить файл на диск"""
-        upload_folder = current_app.config['UPLOAD_FOLDER']
-        os.makedirs(upload_folder, exist_ok=True)
-        file_path = os.path.join(upload_folder, image.storage_filename)
-        file.save(file_path)
+    def _stream_to_file(self, stream, path):
+        """
+        Скопировать поток в файл блоками через временный файл в той же папке
+        :param stream: Поток с содержимым
+        :param path: Итоговый путь файла
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                stream.seek(0)
+                shutil.copyfileobj(stream, out, CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def _hash_file(self, path):
+        """SHA-256 хеш и размер файла"""
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as source:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+        return digest.hexdigest(), size
+
+    def _incoming_path(self, image):
+        """Путь к загруженному, но ещё не обработанному файлу"""
+        return os.path.join(current_app.config['UPLOAD_FOLDER'], image.incoming_filename)
+
+    def _storage_path(self, image):
+        """Путь к файлу изображения в хранилище"""
+        return os.path.join(current_app.config['UPLOAD_FOLDER'], image.storage_filename)
+
+    def get_legacy_images(self):
+        """Изображения, файлы которых ещё лежат вне хранилища blobs"""
+        return self.db.session.execute(
+            self.db.select(Image).filter(
+                Image.blob_hash.is_(None),
+                Image.processing_state == ImageState.READY
+            )
+        ).scalars().all()
+
+    def move_to_blob_store(self, image):
+        """
+        Перенести файл изображения, загруженного до появления blobs, в хранилище
+        :return: False, если файла нет на диске или у животного уже есть такое изображение
+        """
+        legacy_path = self._storage_path(image)
+        if not os.path.exists(legacy_path):
+            return False
+
+        blob_hash, size = self._hash_file(legacy_path)
+        if self._find_by_blob_hash(blob_hash, image.animal_id):
+            return False
+
+        fd, tmp_path = tempfile.mkstemp(dir=current_app.config['UPLOAD_FOLDER'], prefix='.upload-')
+        os.close(fd)
+        shutil.copyfile(legacy_path, tmp_path)
+        created_path = None
+        try:
+            created_path = self.blob_repository.acquire(tmp_path, blob_hash, size, image.mime_type)
+            image.blob_hash = blob_hash
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            self.blob_repository.discard_created_file(blob_hash, created_path)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.invalidate_image_info(image.id)
+        os.remove(legacy_path)
+        return True
@@ -1,4 +1,23 @@
-from ..models import User
+from functools import partial
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from ..cache import LRUCache
+from ..models import User, UserSnapshot
+from ..replicas import read_only
+from ..unit_of_work import on_commit
+
+# Снимки пользователей для load_user: id -> UserSnapshot
+user_cache = LRUCache(maxsize=1024)
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user(mapper, connection, user):
+    # Событие приходит при flush: до commit() параллельный запрос ещё прочитал
+    # бы и закэшировал старые данные, поэтому снимок сбрасывается после commit()
+    on_commit(object_session(user), partial(user_cache.delete, user.id))
 
 class UserRepository:
     def __init__(self, db):
@@ -7,9 +26,37 @@ class UserRepository:
     def get_all_users(self):
         return self.db.session.execute(self.db.select(User)).scalars()
     
+    @read_only
     def get_user_by_id(self, user_id):
         return self.db.session.execute(self.db.select(User).filter_by(id=user_id)).scalar()
 
+    def get_role_id(self, user_id):
+        """
+        Текущая роль пользователя из основной базы, без кэша и реплики
+        :param user_id: ID пользователя
+        :return: ID роли или None, если пользователя нет
+        """
+        return self.db.session.execute(self.db.select(User.role_id).filter_by(id=user_id)).scalar()
+
     def get_user_by_login(self, login):
         return self.db.session.execute(self.db.select(User).filter_by(login=login)).scalar()
-    
\ No newline at end of file
+
+    def get_user_snapshot(self, user_id):
+        """
+        Данные пользователя для авторизации. Снимок кэшируется на USER_CACHE_TTL
+        секунд и сбрасывается после commit() изменения или удаления пользователя
+        через ORM, но только в этом процессе: другие воркеры видят изменение по
+        истечении срока. Поэтому check_rights сверяет роль с базой
+        :param user_id: ID пользователя
+        :return: UserSnapshot или None, если пользователя нет
+        """
+        ttl = current_app.config.get('USER_CACHE_TTL')
+        snapshot = user_cache.get(user_id) if ttl else None
+        if snapshot is None:
+            user = self.get_user_by_id(user_id)
+            if user is None:
+                return None
+            snapshot = UserSnapshot.from_user(user)
+            if ttl:
+                user_cache.set(user_id, snapshot, ttl=ttl)
+        return snapshot
@@ -1,27 +1,126 @@
-from flask import Blueprint, abort, current_app, render_template, send_from_directory, request
+from flask import Blueprint, Response, abort, current_app, make_response, render_template, send_from_directory, request
+from flask_login import current_user, login_required
+from markupsafe import Markup
+from werkzeug.security import safe_join
 
 from .models import db, Animal
 from .repositories.animal_repository import AnimalRepository
 from .repositories.image_repository import ImageRepository
+from .derivatives import FORMATS, SERVED_MIME_TYPES, derivative_filename, get_derivative
+from .cache import catalog_cache
+from .auth import check_rights
 
 bp = Blueprint("main", __name__)
 
 animal_repository = AnimalRepository(db)
 image_repository = ImageRepository(db)
 
+def _role_bucket():
+    """Группа пользователей, которые видят одинаковый каталог"""
+    if current_user.is_authenticated and current_user.is_admin:
+        return 'admin'
+    if current_user.is_authenticated and current_user.is_moderator:
+        return 'moderator'
+    return 'public'
+
+def render_catalog():
+    """
+    Страница каталога. Список карточек кэшируется по (страница, группа
+    пользователей) на CATALOG_CACHE_TTL секунд и сбрасывается при изменении
+    животных и заявок, так что повторные просмотры не обращаются к базе
+    """
+    after = request.args.get('after')
+    page = request.args.get('page', 1, type=int)
+    ttl = current_app.config.get('CATALOG_CACHE_TTL')
+    key = (catalog_cache.generation, request.endpoint, after, page, _role_bucket())
+
+    catalog_html = catalog_cache.get(key) if ttl else None
+    if catalog_html is None:
+        if after is not None:
+            try:
+                animals_page = animal_repository.get_animals_after(after)
+            except ValueError:
+                abort(400)
+        else:
+            animals_page = animal_repository.get_paginated_animals_sorted(page=page)
+        catalog_html = Markup(render_template('main/_catalog.html', animals_page=animals_page))
+        if ttl:
+            catalog_cache.set(key, catalog_html, ttl=ttl)
+
+    return render_template('main/index.html', catalog_html=catalog_html)
+
 @bp.route('/')
 def index():
-    page = request.args.get('page', 1, type=int)
-    animals_page = animal_repository.get_paginated_animals_sorted(page=page)
-    return render_template('main/index.html', animals_page=animals_page)
+    return render_catalog()
+
+def _set_image_cache_headers(response, etag):
+    response.set_etag(etag)
+    # Браузер не должен угадывать тип по содержимому загруженного файла
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['IMAGE_CACHE_MAX_AGE']
+    response.cache_control.immutable = True
+    return response
+
+def _image_etag(content_hash, size=None, fmt=None):
+    """
+    ETag изображения: хеш содержимого оригинала и суффикс копии, если такие
+    размер и формат бывают. Если копию создать не удалось, отдаётся оригинал
+    с ETag оригинала, и его If-None-Match для копии не совпадёт
+    """
+    if size in current_app.config['IMAGE_SIZES'] and (fmt is None or fmt in FORMATS):
+        return derivative_filename(content_hash, size, fmt)
+    return content_hash
 
 @bp.route('/images/<image_id>')
 def serve_image(image_id):
-    image = image_repository.get_by_id(image_id)
+    # Данные изображения обычно берутся из кэша без запроса к базе
+    image = image_repository.get_image_info(image_id)
     if not image:
         abort(404)
-    
-    return send_from_directory(
+
+    size = request.args.get('size')
+    fmt = request.args.get('format')
+    # Содержимое файла с данным хешем не меняется, поэтому совпавший ETag
+    # подтверждается без поиска копии и чтения файла
+    etag = _image_etag(image.content_hash, size, fmt)
+    if etag in request.if_none_match.as_set(include_weak=True):
+        return _set_image_cache_headers(make_response('', 304), etag)
+
+    filename, mime_type = image.storage_filename, image.mime_type
+    etag = image.content_hash
+    if size:
+        derivative = get_derivative(filename, mime_type, size, fmt)
+        if derivative:
+            filename, mime_type = derivative
+            etag = _image_etag(image.content_hash, size, fmt)
+    if mime_type not in SERVED_MIME_TYPES:
+        # Записи до проверки типа по содержимому могли сохранить тип клиента
+        mime_type = 'application/octet-stream'
+
+    accel_prefix = current_app.config.get('IMAGES_ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        # Файл отдаёт nginx из internal location, воркер только ставит заголовок
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = safe_join(accel_prefix, filename)
+        response.mimetype = mime_type
+        return _set_image_cache_headers(response, etag)
+
+    response = send_from_directory(
         current_app.config['UPLOAD_FOLDER'],
-        image.storage_filename
-    )
\ No newline at end of file
+        filename,
+        mimetype=mime_type,
+        etag=etag,
+        max_age=current_app.config['IMAGE_CACHE_MAX_AGE']
+    )
+    return _set_image_cache_headers(response, etag).make_conditional(request)
+
+@bp.route('/metrics')
+@login_required
+@check_rights('view_metrics')
+def metrics():
+    request_metrics = current_app.extensions.get('request_metrics')
+    if request_metrics is None:
+        abort(404)
+    body = request_metrics.render_prometheus() + current_app.extensions['pool_metrics'].render_prometheus()
+    return Response(body, mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,134 @@
+import re
+
+from sqlalchemy import Integer, case, column, func, or_, text
+
+from .models import Animal
+
+# Таблица полнотекстового индекса SQLite (FTS5), rowid совпадает с animals.id.
+# Создаётся миграцией f5c2a8d413e7 или вместе с animals в db.create_all()
+FTS_TABLE = 'animals_fts'
+
+# Диапазоны возраста для фильтра поиска: ключ, подпись, от (мес.), до (мес., не включая)
+AGE_RANGES = [
+    ('0-6', 'до 6 мес.', 0, 6),
+    ('6-12', '6–12 мес.', 6, 12),
+    ('12-36', '1–3 года', 12, 36),
+    ('36-96', '3–8 лет', 36, 96),
+    ('96+', 'старше 8 лет', 96, None),
+]
+
+def search_terms(query):
+    """Слова запроса без операторов полнотекстового поиска"""
+    return re.findall(r'\w+', query or '')
+
+def match_clause(session, query):
+    """
+    Условие WHERE для поиска по имени, породе и описанию. Используется индекс
+    FULLTEXT в MySQL и FTS5 в SQLite, в остальных базах - LIKE
+    :return: Выражение SQLAlchemy или None, если в запросе нет слов
+    """
+    terms = search_terms(query)
+    if not terms:
+        return None
+
+    dialect = session.get_bind().dialect.name
+    if dialect == 'mysql':
+        # Все слова обязательны и ищутся как начало слова
+        against = ' '.join(f'+{term}*' for term in terms)
+        return text(
+            'MATCH (animals.name, animals.breed, animals.description) '
+            'AGAINST (:search_query IN BOOLEAN MODE)'
+        ).bindparams(search_query=against)
+    if dialect == 'sqlite':
+        against = ' '.join(f'"{term}"*' for term in terms)
+        return Animal.id.in_(
+            text(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :search_query')
+            .bindparams(search_query=against)
+            .columns(column('rowid', Integer))
+        )
+    return or_(*(
+        or_(
+            Animal.name.ilike(f'%{term}%'),
+            Animal.breed.ilike(f'%{term}%'),
+            Animal.description.ilike(f'%{term}%')
+        )
+        for term in terms
+    ))
+
+def age_range_clause(key):
+    """Условие на age_months для ключа из AGE_RANGES или None для неизвестного ключа"""
+    for range_key, _, low, high in AGE_RANGES:
+        if range_key == key:
+            if high is None:
+                return Animal.age_months >= low
+            return Animal.age_months.between(low, high - 1)
+    return None
+
+def age_range_column():
+    """Выражение с ключом диапазона возраста для группировки"""
+    return case(
+        *(
+            (Animal.age_months < high, key)
+            for key, _, _, high in AGE_RANGES if high is not None
+        ),
+        else_=AGE_RANGES[-1][0]
+    )
+
+def index_animal(session, animal):
+    """
+    Обновить запись животного в индексе в текущей транзакции. Индекс FULLTEXT
+    MySQL обновляется самой базой, поддерживать нужно только FTS5
+    """
+    if session.get_bind().dialect.name != 'sqlite':
+        return
+    session.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid = :id'), {'id': animal.id})
+    session.execute(
+        text(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, breed, description) '
+            'VALUES (:id, :name, :breed, :description)'
+        ),
+        {
+            'id': animal.id,
+            'name': animal.name,
+            'breed': animal.breed,
+            'description': animal.description,
+        }
+    )
+
+def index_new_animals(session, rows):
+    """
+    Добавить в индекс пакет новых животных одним executemany
+    :param rows: Словари с ключами id, name, breed, description
+    """
+    if not rows or session.get_bind().dialect.name != 'sqlite':
+        return
+    session.execute(
+        text(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, breed, description) '
+            'VALUES (:id, :name, :breed, :description)'
+        ),
+        [
+            {key: row[key] for key in ('id', 'name', 'breed', 'description')}
+            for row in rows
+        ]
+    )
+
+def remove_animal(session, animal_id):
+    """Удалить животное из индекса в текущей транзакции"""
+    if session.get_bind().dialect.name != 'sqlite':
+        return
+    session.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid = :id'), {'id': animal_id})
+
+def rebuild_index(session):
+    """
+    Перестроить индекс по таблице animals
+    :return: Число проиндексированных животных или None, если индекс ведёт база
+    """
+    if session.get_bind().dialect.name != 'sqlite':
+        return None
+    session.execute(text(f'DELETE FROM {FTS_TABLE}'))
+    session.execute(text(
+        f'INSERT INTO {FTS_TABLE} (rowid, name, breed, description) '
+        'SELECT id, name, breed, description FROM animals'
+    ))
+    return session.execute(func.count(Animal.id).select()).scalar()
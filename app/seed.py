@@ -0,0 +1,308 @@
+import hashlib
+import io
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, insert, select
+
+from . import search
+from .models import (
+    db, Adoption, AdoptionStatus, Animal, AnimalStatus, Blob, Image, ImageState,
+    User, UserRole, ROLE_ADMIN, ROLE_MODERATOR, ROLE_USER
+)
+from .repositories.adoption_repository import AdoptionRepository
+from .passwords import hash_password
+from .rendering import content_hash, render_markdown
+
+try:
+    from PIL import Image as PILImage
+except ImportError:  # Без Pillow используются готовые однотонные GIF
+    PILImage = None
+
+# Пароль всех созданных пользователей
+SEED_PASSWORD = 'password'
+
+ROLES = [
+    (ROLE_ADMIN, 'admin', 'Администратор с полными правами доступа'),
+    (ROLE_MODERATOR, 'moderator', 'Модератор'),
+    (ROLE_USER, 'user', 'Пользователь'),
+]
+
+NAMES = [
+    'Барсик', 'Мурка', 'Рекс', 'Шарик', 'Ева', 'Кирилл', 'Лайма', 'Граф', 'Пушок',
+    'Бусинка', 'Тишка', 'Джек', 'Белка', 'Соня', 'Марс', 'Луна', 'Рыжик', 'Зефир',
+]
+BREEDS = {
+    'cat': ['Сиамская', 'Тайская', 'Сибирская', 'Британская', 'Беспородная'],
+    'dog': ['Овчарка', 'Лабрадор', 'Такса', 'Хаски', 'Дворняга'],
+}
+DESCRIPTIONS = [
+    '**{name}** - спокойный и ласковый питомец. Любит детей и быстро привыкает к дому.',
+    '{name} очень активен, любит долгие прогулки и игры с мячом.\n\n- привит\n- стерилизован',
+    'Немного стеснительный, но после знакомства {name} не отходит от хозяина ни на шаг.',
+    '{name} попал в приют с улицы. Здоров, приучен к лотку и когтеточке.',
+]
+# Доля животных по статусам: большинство доступно, часть уже усыновлена
+STATUS_WEIGHTS = {
+    AnimalStatus.AVAILABLE: 6,
+    AnimalStatus.ADOPTION: 2,
+    AnimalStatus.ADOPTED: 2,
+}
+# Число разных файлов изображений; изображения животных ссылаются на них по кругу
+DISTINCT_IMAGES = 16
+
+def seed_data(animals=0, adoptions=0, images=0, users=None, chunk_size=5000, progress=None):
+    """
+    Заполнить базу синтетическими данными пакетными INSERT
+    :param animals: Число животных
+    :param adoptions: Общее число заявок (распределяются неравномерно: у
+                      популярных животных их много)
+    :param images: Число изображений (файлы хранятся один раз в хранилище blobs)
+    :param users: Число пользователей, по умолчанию столько, чтобы хватило на заявки
+    :param chunk_size: Размер пакета INSERT
+    :param progress: Функция для вывода хода заполнения
+    :return: Словарь с числом созданных строк по таблицам
+    """
+    progress = progress or (lambda message: None)
+    session = db.session
+    started = time.perf_counter()
+    created = {'users': 0, 'animals': 0, 'adoptions': 0, 'images': 0}
+
+    _ensure_roles(session)
+    animal_ids = _seed_animals(session, animals, chunk_size, progress) if animals else []
+    created['animals'] = len(animal_ids)
+    if not animal_ids and (adoptions or images):
+        animal_ids = session.execute(select(Animal.id)).scalars().all()
+
+    if adoptions and animal_ids:
+        if users is None:
+            # Пользователь подаёт не больше одной заявки на животное, поэтому
+            # пользователей должно хватить на самых популярных животных
+            users = max(100, adoptions // 10)
+        user_ids = _seed_users(session, users, chunk_size)
+        created['users'] = len(user_ids)
+        created['adoptions'] = _seed_adoptions(
+            session, animal_ids, user_ids, adoptions, chunk_size, progress
+        )
+    elif users:
+        created['users'] = len(_seed_users(session, users, chunk_size))
+
+    if images and animal_ids:
+        created['images'] = _seed_images(session, animal_ids, images, chunk_size)
+
+    search.rebuild_index(session)
+    session.commit()
+    progress(f'Seeded in {time.perf_counter() - started:.1f}s')
+    return created
+
+def _ensure_roles(session):
+    existing = set(session.execute(select(UserRole.id)).scalars())
+    missing = [
+        {'id': role_id, 'name': name, 'description': description}
+        for role_id, name, description in ROLES if role_id not in existing
+    ]
+    if missing:
+        session.execute(insert(UserRole), missing)
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _run_id(session):
+    # Уникальная часть логинов, чтобы можно было запускать заполнение повторно
+    return f'{int(time.time())}-{session.execute(select(func.count(User.id))).scalar()}'
+
+def _seed_users(session, count, chunk_size):
+    run_id = _run_id(session)
+    password_hash = hash_password(SEED_PASSWORD)
+    now = datetime.now()
+    rows = (
+        {
+            'login': f'seed-{run_id}-{i}',
+            'password_hash': password_hash,
+            'first_name': random.choice(NAMES),
+            'last_name': f'Тестов{i}',
+            'created_at': now,
+            'role_id': ROLE_USER,
+        }
+        for i in range(count)
+    )
+    for chunk in _chunks(rows, chunk_size):
+        session.execute(insert(User), chunk)
+    return session.execute(
+        select(User.id).filter(User.login.like(f'seed-{run_id}-%')).order_by(User.id)
+    ).scalars().all()
+
+def _seed_animals(session, count, chunk_size, progress):
+    # Описания рендерятся один раз на шаблон и имя, а не на каждую строку
+    rendered = {}
+    def description(name):
+        key = (random.randrange(len(DESCRIPTIONS)), name)
+        if key not in rendered:
+            text = DESCRIPTIONS[key[0]].format(name=name)
+            rendered[key] = (text, render_markdown(text), content_hash(text))
+        return rendered[key]
+
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+    now = datetime.now()
+    max_id = session.execute(select(func.max(Animal.id))).scalar() or 0
+
+    def rows():
+        for i in range(count):
+            name = random.choice(NAMES)
+            text, html, digest = description(name)
+            kind = random.choice(list(BREEDS))
+            yield {
+                'name': name,
+                'description': text,
+                'description_html': html,
+                'description_hash': digest,
+                'age_months': random.randint(1, 180),
+                'breed': random.choice(BREEDS[kind]),
+                'gender': random.choice(['male', 'female']),
+                'status': random.choices(statuses, weights)[0],
+                'created_at': now - timedelta(minutes=i),
+                'adoption_count': 0,
+                'pending_count': 0,
+            }
+
+    done = 0
+    for chunk in _chunks(rows(), chunk_size):
+        session.execute(insert(Animal), chunk)
+        done += len(chunk)
+        progress(f'  animals: {done}/{count}')
+    return session.execute(
+        select(Animal.id).filter(Animal.id > max_id).order_by(Animal.id)
+    ).scalars().all()
+
+def _seed_adoptions(session, animal_ids, user_ids, count, chunk_size, progress):
+    # Распределение Парето: несколько животных собирают большую часть заявок,
+    # пользователь подаёт не больше одной заявки на животное
+    weights = [random.paretovariate(1.2) for _ in animal_ids]
+    limit = len(user_ids)
+    count = min(count, limit * len(animal_ids))
+    per_animal = {}
+    overflow = 0
+    for animal_id in random.choices(animal_ids, weights, k=count):
+        if per_animal.get(animal_id, 0) < limit:
+            per_animal[animal_id] = per_animal.get(animal_id, 0) + 1
+        else:
+            overflow += 1
+    # Заявки сверх числа пользователей достаются случайным животным
+    while overflow:
+        animal_id = random.choice(animal_ids)
+        if per_animal.get(animal_id, 0) < limit:
+            per_animal[animal_id] = per_animal.get(animal_id, 0) + 1
+            overflow -= 1
+
+    now = datetime.now()
+    def rows():
+        for ids in _chunks(per_animal, chunk_size):
+            adopted = set(session.execute(
+                select(Animal.id).filter(Animal.id.in_(ids), Animal.status == AnimalStatus.ADOPTED)
+            ).scalars())
+            for animal_id in ids:
+                for offset, user_id in enumerate(random.sample(user_ids, per_animal[animal_id])):
+                    if animal_id not in adopted:
+                        status = AdoptionStatus.PENDING
+                    elif offset == 0:
+                        status = AdoptionStatus.ACCEPTED
+                    else:
+                        status = AdoptionStatus.REJECTED_ADOPTED
+                    yield {
+                        'application_date': now - timedelta(minutes=offset),
+                        'status': status,
+                        'contact_info': f'+7900{user_id:07d}',
+                        'animal_id': animal_id,
+                        'user_id': user_id,
+                    }
+
+    done = 0
+    for chunk in _chunks(rows(), chunk_size):
+        session.execute(insert(Adoption), chunk)
+        done += len(chunk)
+        progress(f'  adoptions: {done}')
+
+    # Счётчики животных пересчитываются по таблице adoptions
+    AdoptionRepository(db).repair_counters()
+    return done
+
+def _seed_images(session, animal_ids, count, chunk_size):
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    blobs = []
+    for index in range(min(DISTINCT_IMAGES, count)):
+        content, mime_type = _sample_image(index)
+        blob_hash = hashlib.sha256(content).hexdigest()
+        path = os.path.join(upload_folder, Blob.path_for(blob_hash))
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as out:
+                out.write(content)
+        blobs.append((blob_hash, len(content), mime_type))
+
+    existing = set(session.execute(select(Blob.hash)).scalars())
+    new_blobs = [
+        {'hash': h, 'size': size, 'mime_type': mime, 'refcount': 0, 'created_at': datetime.now()}
+        for h, size, mime in blobs if h not in existing
+    ]
+    if new_blobs:
+        session.execute(insert(Blob), new_blobs)
+
+    # У одного животного не больше DISTINCT_IMAGES изображений: пара
+    # (animal_id, blob_hash) уникальна
+    count = min(count, len(animal_ids) * len(blobs))
+    refcounts = {}
+    taken = set(session.execute(
+        select(Image.animal_id, Image.blob_hash).filter(Image.blob_hash.is_not(None))
+    ).tuples())
+
+    def rows():
+        for i in range(count):
+            animal_id = animal_ids[i % len(animal_ids)]
+            blob_hash, _, mime_type = blobs[(i // len(animal_ids)) % len(blobs)]
+            if (animal_id, blob_hash) in taken:
+                continue
+            refcounts[blob_hash] = refcounts.get(blob_hash, 0) + 1
+            yield {
+                'id': f'seed-{animal_id}-{blob_hash[:16]}',
+                'file_name': f'seed.{mime_type.rsplit("/", 1)[1]}',
+                'mime_type': mime_type,
+                'animal_id': animal_id,
+                'blob_hash': blob_hash,
+                'processing_state': ImageState.READY,
+            }
+
+    done = 0
+    for chunk in _chunks(rows(), chunk_size):
+        session.execute(insert(Image), chunk)
+        done += len(chunk)
+    for blob_hash, refs in refcounts.items():
+        session.execute(
+            Blob.__table__.update()
+            .where(Blob.hash == blob_hash)
+            .values(refcount=Blob.refcount + refs)
+        )
+    return done
+
+def _sample_image(index):
+    """Небольшое изображение с уникальным содержимым: (байты, MIME тип)"""
+    color = ((index * 67) % 256, (index * 139) % 256, (index * 29) % 256)
+    if PILImage is not None:
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (1200, 900), color).save(buffer, 'JPEG', quality=85)
+        return buffer.getvalue(), 'image/jpeg'
+    # GIF 1x1 с цветом палитры
+    return (
+        b'GIF89a\x01\x00\x01\x00\x80\x00\x00' + bytes(color) + b'\x00\x00\x00'
+        b'!\xf9\x04\x00\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;'
+    ), 'image/gif'
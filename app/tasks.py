@@ -0,0 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from .models import db
+from .repositories.image_repository import ImageRepository
+
+def init_tasks(app):
+    workers = app.config.get('IMAGE_WORKERS', 0)
+    app.extensions['image_executor'] = (
+        ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-worker')
+        if workers else None
+    )
+
+def enqueue_image_processing(image_id):
+    """
+    Поставить обработку изображения в очередь фонового пула потоков.
+    Если пул отключён (IMAGE_WORKERS = 0), изображение остаётся в состоянии
+    PENDING и его заберёт `flask images process-pending`
+    """
+    app = current_app._get_current_object()
+    executor = app.extensions.get('image_executor')
+    if executor is not None:
+        return executor.submit(_process_image, app, image_id)
+
+def _process_image(app, image_id):
+    with app.app_context():
+        try:
+            ImageRepository(db).process_image(image_id)
+        except Exception as e:
+            app.logger.error(f"Error processing image {image_id}: {e}")
@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+# Ключи session.info со списками функций, которые нужно вызвать после
+# завершения транзакции
+ON_COMMIT = 'on_commit'
+ON_ROLLBACK = 'on_rollback'
+
+def on_commit(session, callback):
+    """
+    Вызвать callback после commit() текущей транзакции (сброс кэшей, удаление
+    файлов, постановка фоновых задач). При откате транзакции не вызывается
+    """
+    hooks = session.info.setdefault(ON_COMMIT, [])
+    if callback not in hooks:
+        hooks.append(callback)
+
+def on_rollback(session, callback):
+    """
+    Вызвать callback, если транзакция или точка сохранения, в которой он
+    зарегистрирован, будет отменена (например, удалить уже записанный файл)
+    """
+    session.info.setdefault(ON_ROLLBACK, []).append(callback)
+
+@contextmanager
+def savepoint(session):
+    """
+    Точка сохранения внутри транзакции запроса. Ошибка в блоке отменяет только
+    его изменения: функции on_rollback блока вызываются, on_commit забываются,
+    а исключение передаётся дальше
+    """
+    commit_mark = len(session.info.get(ON_COMMIT, ()))
+    rollback_mark = len(session.info.get(ON_ROLLBACK, ()))
+    try:
+        with session.begin_nested():
+            yield
+    except Exception:
+        del session.info.get(ON_COMMIT, [])[commit_mark:]
+        hooks = session.info.get(ON_ROLLBACK, [])
+        _run_hooks(hooks[rollback_mark:])
+        del hooks[rollback_mark:]
+        raise
+
+def _run_hooks(hooks):
+    for callback in hooks:
+        try:
+            callback()
+        except Exception as e:
+            current_app.logger.error(f"Error in transaction hook {callback!r}: {e}")
+
+@event.listens_for(Session, 'after_commit')
+def _run_commit_hooks(session):
+    # after_commit приходит и при освобождении точки сохранения
+    if session.in_nested_transaction():
+        return
+    session.info.pop(ON_ROLLBACK, None)
+    _run_hooks(session.info.pop(ON_COMMIT, []))
+
+@event.listens_for(Session, 'after_transaction_end')
+def _run_rollback_hooks(session, transaction):
+    # Внешняя транзакция закончилась без commit(): откат или закрытие сессии
+    # в конце запроса
+    if transaction.parent is None:
+        session.info.pop(ON_COMMIT, None)
+        _run_hooks(session.info.pop(ON_ROLLBACK, []))
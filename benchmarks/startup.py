@@ -0,0 +1,170 @@
+"""Measure cold start: package import, app creation and the first request.
+
+Every run starts a fresh interpreter, as a pre-forked worker or a `flask`
+command does, and records:
+
+    import_ms           `import app` (the application itself is created lazily)
+    create_app_ms       create_app(): blueprints, repositories, extensions
+    first_request_ms    the first GET / (template compilation, first connection)
+    warm_request_ms     the second GET / for comparison
+
+One more run under `python -X importtime` lists the modules that take the
+longest to import:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --save-baseline    # accept current numbers
+
+The numbers are medians over --repeat runs. A step regresses when its median
+is slower than the baseline by more than --tolerance; the script then exits
+with 1. Like the route baseline, the numbers are machine specific.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.join(BENCHMARKS_DIR, '..')
+MIGRATIONS_DIR = os.path.join(ROOT_DIR, 'migrations')
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, 'startup_baseline.json')
+STEPS = ('import_ms', 'create_app_ms', 'first_request_ms', 'warm_request_ms')
+
+def child(database_uri, upload_folder):
+    """Замеры в свежем процессе, результат - JSON в stdout"""
+    sys.path.insert(0, ROOT_DIR)
+    timings = {}
+    started = time.perf_counter()
+    import app
+    timings['import_ms'] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    application = app.create_app({
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'UPLOAD_FOLDER': upload_folder,
+    })
+    timings['create_app_ms'] = (time.perf_counter() - started) * 1000
+
+    client = application.test_client()
+    for step in ('first_request_ms', 'warm_request_ms'):
+        started = time.perf_counter()
+        response = client.get('/')
+        timings[step] = (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            raise SystemExit(f'GET /: HTTP {response.status_code}')
+
+    timings['modules'] = len(sys.modules)
+    timings['flask_migrate_loaded'] = 'flask_migrate' in sys.modules
+    print(json.dumps(timings))
+
+def prepare(database_uri, upload_folder):
+    """Мигрировать и заполнить временную базу в отдельном процессе"""
+    sys.path.insert(0, ROOT_DIR)
+    from flask_migrate import upgrade
+    from app import create_app
+    from app.models import db, Animal
+    from app.seed import seed_data
+
+    application = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'UPLOAD_FOLDER': upload_folder,
+        'MIGRATIONS_ENABLED': True,
+    })
+    with application.app_context():
+        upgrade(directory=MIGRATIONS_DIR)
+        if not db.session.execute(db.select(db.func.count(Animal.id))).scalar():
+            seed_data(animals=100, adoptions=200, images=20)
+
+def run_child(args, mode='--child', extra_flags=()):
+    return subprocess.run(
+        [sys.executable, *extra_flags, os.path.abspath(__file__),
+         mode, '--database-uri', args.database_uri, '--upload-folder', args.upload_folder],
+        capture_output=True, text=True, check=True
+    )
+
+def slowest_imports(stderr, limit):
+    """
+    Модули первых двух уровней вложенности с наибольшим суммарным временем
+    импорта (мс): пакеты приложения и библиотеки, которые они импортируют
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            imports.append((int(cumulative) / 1000, name.strip()))
+    imports.sort(reverse=True)
+    return imports[:limit]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--prepare', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--database-uri', help='Database to use (default: a temporary SQLite file).')
+    parser.add_argument('--upload-folder')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports to list.')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='Allowed median slowdown relative to the baseline.')
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.database_uri, args.upload_folder)
+        return
+    if args.prepare:
+        prepare(args.database_uri, args.upload_folder)
+        return
+
+    if not args.database_uri:
+        workdir = tempfile.mkdtemp(prefix='startup-')
+        args.database_uri = 'sqlite:///' + os.path.join(workdir, 'startup.sqlite')
+        args.upload_folder = args.upload_folder or os.path.join(workdir, 'images')
+    args.upload_folder = args.upload_folder or tempfile.mkdtemp(prefix='startup-images-')
+    run_child(args, mode='--prepare')
+
+    runs = [json.loads(run_child(args).stdout) for _ in range(args.repeat)]
+    results = {step: round(statistics.median(run[step] for run in runs), 3) for step in STEPS}
+    for step in STEPS:
+        print(f'{step:20} median {results[step]:9.2f} ms   '
+              f'max {max(run[step] for run in runs):9.2f} ms')
+    print(f"{'modules loaded':20} {runs[0]['modules']}"
+          f"{' (flask_migrate imported)' if runs[0]['flask_migrate_loaded'] else ''}")
+
+    print('\nSlowest top-level imports (python -X importtime):')
+    profile = run_child(args, extra_flags=('-X', 'importtime'))
+    for cumulative, name in slowest_imports(profile.stderr, args.top):
+        print(f'  {cumulative:9.2f} ms  {name}')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+            out.write('\n')
+        print(f'\nBaseline saved to {args.baseline}')
+        return
+
+    if not os.path.exists(args.baseline):
+        print('\nNo baseline to compare with, run with --save-baseline first')
+        return
+    with open(args.baseline) as source:
+        baseline = json.load(source)
+    regressions = [
+        f'{step}: median {results[step]:.2f} ms, baseline {baseline[step]:.2f} ms '
+        f'(+{args.tolerance:.0%} allowed)'
+        for step in STEPS
+        if step in baseline and results[step] > baseline[step] * (1 + args.tolerance)
+    ]
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if regressions:
+        sys.exit(1)
+    print('\nNo regressions against the baseline')
+
+if __name__ == '__main__':
+    main()
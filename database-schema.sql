@@ -30,8 +30,10 @@ CREATE TABLE `adoptions` (
   `animal_id` int NOT NULL,
   `user_id` int NOT NULL,
   PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_adoptions_user_id` (`user_id`,`animal_id`),
   KEY `fk_adoptions_animal_id_animals` (`animal_id`),
   KEY `fk_adoptions_user_id_users` (`user_id`),
+  KEY `ix_adoptions_animal_id_application_date` (`animal_id`,`application_date`),
   CONSTRAINT `fk_adoptions_animal_id_animals` FOREIGN KEY (`animal_id`) REFERENCES `animals` (`id`) ON DELETE CASCADE,
   CONSTRAINT `fk_adoptions_user_id_users` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB AUTO_INCREMENT=5 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
@@ -61,15 +63,39 @@ CREATE TABLE `animals` (
   `id` int NOT NULL AUTO_INCREMENT,
   `name` varchar(50) NOT NULL,
   `description` text NOT NULL,
+  `description_html` text,
+  `description_hash` varchar(64) DEFAULT NULL,
   `age_months` int NOT NULL,
   `breed` varchar(100) NOT NULL,
   `gender` varchar(20) NOT NULL,
   `status` enum('AVAILABLE','ADOPTION','ADOPTED') NOT NULL,
   `created_at` datetime NOT NULL,
-  PRIMARY KEY (`id`)
+  `adoption_count` int NOT NULL DEFAULT '0',
+  `pending_count` int NOT NULL DEFAULT '0',
+  `status_rank` int GENERATED ALWAYS AS ((case `status` when _utf8mb4'AVAILABLE' then 0 when _utf8mb4'ADOPTION' then 1 when _utf8mb4'ADOPTED' then 2 else 3 end)) STORED,
+  PRIMARY KEY (`id`),
+  KEY `ix_animals_status_rank_created_at_id` (`status_rank`,`created_at` DESC,`id` DESC),
+  FULLTEXT KEY `ix_animals_fulltext` (`name`,`breed`,`description`)
 ) ENGINE=InnoDB AUTO_INCREMENT=18 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
+--
+-- Table structure for table `blobs`
+--
+
+DROP TABLE IF EXISTS `blobs`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `blobs` (
+  `hash` varchar(64) NOT NULL,
+  `size` int NOT NULL,
+  `mime_type` varchar(100) NOT NULL,
+  `refcount` int NOT NULL DEFAULT '0',
+  `created_at` datetime NOT NULL,
+  PRIMARY KEY (`hash`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
 --
 -- Table structure for table `images`
 --
@@ -81,14 +107,34 @@ CREATE TABLE `images` (
   `id` varchar(100) NOT NULL,
   `file_name` varchar(100) NOT NULL,
   `mime_type` varchar(100) NOT NULL,
-  `md5_hash` varchar(100) NOT NULL,
+  `md5_hash` varchar(100) DEFAULT NULL,
   `object_id` int DEFAULT NULL,
   `object_type` varchar(100) DEFAULT NULL,
   `animal_id` int NOT NULL,
+  `blob_hash` varchar(64) DEFAULT NULL,
+  `processing_state` enum('PENDING','PROCESSING','READY','FAILED') NOT NULL DEFAULT 'READY',
+  `created_at` datetime NOT NULL,
   PRIMARY KEY (`id`),
-  UNIQUE KEY `uq_images_md5_hash` (`md5_hash`),
-  KEY `fk_images_animal_id_animals` (`animal_id`),
-  CONSTRAINT `fk_images_animal_id_animals` FOREIGN KEY (`animal_id`) REFERENCES `animals` (`id`)
+  UNIQUE KEY `uq_images_animal_id` (`animal_id`,`blob_hash`),
+  KEY `fk_images_blob_hash_blobs` (`blob_hash`),
+  CONSTRAINT `fk_images_animal_id_animals` FOREIGN KEY (`animal_id`) REFERENCES `animals` (`id`),
+  CONSTRAINT `fk_images_blob_hash_blobs` FOREIGN KEY (`blob_hash`) REFERENCES `blobs` (`hash`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Table structure for table `import_progress`
+--
+
+DROP TABLE IF EXISTS `import_progress`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `import_progress` (
+  `run_id` varchar(36) NOT NULL,
+  `source` varchar(500) NOT NULL,
+  `records` int NOT NULL DEFAULT '0',
+  `updated_at` datetime NOT NULL,
+  PRIMARY KEY (`run_id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
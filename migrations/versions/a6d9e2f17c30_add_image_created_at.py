@@ -0,0 +1,75 @@
+"""Add image created_at
+
+Revision ID: a6d9e2f17c30
+Revises: f5c2a8d413e7
+Create Date: 2026-10-18 19:12:27.504113
+
+"""
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d9e2f17c30'
+down_revision = 'f5c2a8d413e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+
+    data_upgrades()
+
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.drop_column('created_at')
+
+
+def data_upgrades():
+    """
+    Существующим изображениям проставляется время в порядке, в котором их
+    показывал каталог: от времени создания животного с шагом в секунду. Время
+    blob для этого не подходит: у blob из миграции d81f3a6b2c47 оно одинаковое,
+    а повторно загруженный файл получает время первой загрузки
+    """
+    images = sa.sql.table('images',
+        sa.sql.column('id', sa.String),
+        sa.sql.column('animal_id', sa.Integer),
+        sa.sql.column('created_at', sa.DateTime)
+    )
+    animals = sa.sql.table('animals',
+        sa.sql.column('id', sa.Integer),
+        sa.sql.column('created_at', sa.DateTime)
+    )
+
+    connection = op.get_bind()
+    # Без ORDER BY строки отдавались в порядке вставки (rowid) в SQLite и в
+    # порядке первичного ключа в InnoDB
+    if connection.dialect.name == 'sqlite':
+        insertion_order = sa.literal_column('images.rowid')
+    else:
+        insertion_order = images.c.id
+    rows = connection.execute(
+        sa.select(images.c.id, images.c.animal_id, animals.c.created_at)
+        .join(animals, animals.c.id == images.c.animal_id)
+        .order_by(images.c.animal_id, insertion_order)
+    ).all()
+
+    position = 0
+    previous_animal_id = None
+    for image_id, animal_id, animal_created_at in rows:
+        position = position + 1 if animal_id == previous_animal_id else 0
+        previous_animal_id = animal_id
+        connection.execute(
+            images.update()
+            .where(images.c.id == image_id)
+            .values(created_at=animal_created_at + timedelta(seconds=position))
+        )
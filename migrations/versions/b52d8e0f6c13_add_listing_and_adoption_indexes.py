@@ -0,0 +1,60 @@
+"""Add listing and adoption indexes
+
+Revision ID: b52d8e0f6c13
+Revises: 7a4e2c91d05b
+Create Date: 2026-10-18 11:48:02.930174
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b52d8e0f6c13'
+down_revision = '7a4e2c91d05b'
+branch_labels = None
+depends_on = None
+
+STATUS_RANK_SQL = (
+    "CASE status WHEN 'AVAILABLE' THEN 0 WHEN 'ADOPTION' THEN 1 "
+    "WHEN 'ADOPTED' THEN 2 ELSE 3 END"
+)
+
+def check_duplicate_adoptions():
+    """Не добавлять ограничение уникальности, если в заявках есть дубликаты"""
+
+    duplicates = op.get_bind().execute(sa.text(
+        'SELECT COUNT(*) FROM ('
+        ' SELECT user_id, animal_id FROM adoptions'
+        ' GROUP BY user_id, animal_id HAVING COUNT(*) > 1'
+        ') AS duplicates'
+    )).scalar()
+    if duplicates:
+        raise RuntimeError(
+            f'{duplicates} (user_id, animal_id) pairs have more than one adoption; '
+            'remove the duplicates before upgrading.'
+        )
+
+def upgrade():
+    check_duplicate_adoptions()
+
+    # SQLite добавляет хранимый вычисляемый столбец только при пересоздании таблицы
+    recreate = 'always' if op.get_bind().dialect.name == 'sqlite' else 'auto'
+    with op.batch_alter_table('animals', schema=None, recreate=recreate) as batch_op:
+        batch_op.add_column(sa.Column('status_rank', sa.Integer(), sa.Computed(STATUS_RANK_SQL, persisted=True), nullable=True))
+
+    op.create_index('ix_animals_status_rank_created_at_id', 'animals', ['status_rank', sa.text('created_at DESC'), sa.text('id DESC')], unique=False)
+
+    with op.batch_alter_table('adoptions', schema=None) as batch_op:
+        batch_op.create_unique_constraint(batch_op.f('uq_adoptions_user_id'), ['user_id', 'animal_id'])
+        batch_op.create_index('ix_adoptions_animal_id_application_date', ['animal_id', 'application_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('adoptions', schema=None) as batch_op:
+        batch_op.drop_index('ix_adoptions_animal_id_application_date')
+        batch_op.drop_constraint(batch_op.f('uq_adoptions_user_id'), type_='unique')
+
+    op.drop_index('ix_animals_status_rank_created_at_id', table_name='animals')
+    with op.batch_alter_table('animals', schema=None) as batch_op:
+        batch_op.drop_column('status_rank')
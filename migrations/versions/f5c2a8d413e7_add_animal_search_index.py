@@ -0,0 +1,50 @@
+"""Add animal search index
+
+Revision ID: f5c2a8d413e7
+Revises: e3a7c5f90b18
+Create Date: 2026-10-18 16:05:41.318907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5c2a8d413e7'
+down_revision = 'e3a7c5f90b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'mysql':
+        op.create_index(
+            'ix_animals_fulltext',
+            'animals',
+            ['name', 'breed', 'description'],
+            unique=False,
+            mysql_prefix='FULLTEXT'
+        )
+    elif dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS animals_fts "
+            "USING fts5(name, breed, description, tokenize = 'unicode61')"
+        )
+        data_upgrades()
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'mysql':
+        op.drop_index('ix_animals_fulltext', table_name='animals')
+    elif dialect == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS animals_fts')
+
+
+def data_upgrades():
+    """Заполнить индекс FTS5 существующими животными"""
+    op.execute(
+        'INSERT INTO animals_fts (rowid, name, breed, description) '
+        'SELECT id, name, breed, description FROM animals'
+    )
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+from flask_migrate import upgrade
+
+from app import create_app
+from app.models import db, Animal, AnimalStatus, User, ROLE_ADMIN
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'migrations')
+
+@pytest.fixture
+def app(tmp_path):
+    """Приложение с мигрированной базой SQLite во временной папке"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.sqlite'),
+        'UPLOAD_FOLDER': str(tmp_path / 'images'),
+        'MIGRATIONS_ENABLED': True,
+        'IMAGE_WORKERS': 0,
+        'PASSWORD_WORKERS': 0,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'CATALOG_CACHE_TTL': 0,
+        'USER_CACHE_TTL': 0,
+    })
+    with app.app_context():
+        upgrade(directory=MIGRATIONS_DIR)
+        yield app
+        db.session.remove()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def animal(app):
+    animal = Animal(name='Барсик', breed='Дворовый', age_months=12, gender='male',
+                    status=AnimalStatus.AVAILABLE)
+    animal.set_description('Ласковый кот')
+    db.session.add(animal)
+    db.session.commit()
+    return animal
+
+@pytest.fixture
+def admin(app):
+    user = User(login='admin', first_name='Админ', last_name='Админов', role_id=ROLE_ADMIN)
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def login_as(client, user):
+    """Сессия пользователя без проверки пароля"""
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
@@ -0,0 +1,76 @@
+from sqlalchemy.exc import OperationalError
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app.models import db, User, ROLE_MODERATOR
+from app.repositories.user_repository import user_cache
+
+from conftest import login_as
+
+def use_outdated_hash(user):
+    user.password_hash = generate_password_hash('password', method='pbkdf2:sha256:500')
+    db.session.commit()
+
+def test_login_succeeds_when_rehash_commit_fails(app, client, admin, monkeypatch):
+    use_outdated_hash(admin)
+    session_class = type(db.session())
+    commit = session_class.commit
+
+    def failing_commit(session):
+        if any(isinstance(obj, User) for obj in session.dirty):
+            raise OperationalError('UPDATE users', {}, Exception('lock wait timeout'))
+        return commit(session)
+
+    monkeypatch.setattr(session_class, 'commit', failing_commit)
+    response = client.post('/auth/login', data={'login': 'admin', 'password': 'password'})
+
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        assert session['_user_id'] == str(admin.id)
+
+def test_login_rehashes_outdated_hash(app, client, admin):
+    use_outdated_hash(admin)
+    response = client.post('/auth/login', data={'login': 'admin', 'password': 'password'})
+
+    assert response.status_code == 302
+    db.session.expire_all()
+    user = db.session.get(User, admin.id)
+    assert user.password_hash.startswith('pbkdf2:sha256:1000$')
+    assert check_password_hash(user.password_hash, 'password')
+
+def test_only_failed_logins_count_against_login(app, client, admin):
+    app.extensions['login_throttles']['login'].limit = 2
+    for _ in range(3):
+        assert client.post('/auth/login', data={'login': 'admin', 'password': 'password'}).status_code == 302
+    for _ in range(2):
+        client.post('/auth/login', data={'login': 'admin', 'password': 'wrong'})
+    assert client.post('/auth/login', data={'login': 'admin', 'password': 'password'}).status_code == 429
+
+def test_check_rights_sees_role_change_from_another_worker(app, client, admin):
+    app.config['USER_CACHE_TTL'] = 60
+    user_cache.clear()
+    login_as(client, admin)
+    assert client.get('/animals/create').status_code == 200
+    assert admin.id in user_cache
+
+    # Другой воркер меняет роль: кэш этого процесса не сбрасывается
+    with db.engine.begin() as connection:
+        connection.execute(db.update(User).where(User.id == admin.id).values(role_id=ROLE_MODERATOR))
+
+    response = client.get('/animals/create')
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/'
+
+def test_check_rights_logs_out_user_deleted_in_another_worker(app, client, admin):
+    app.config['USER_CACHE_TTL'] = 60
+    user_cache.clear()
+    login_as(client, admin)
+    assert client.get('/animals/create').status_code == 200
+
+    with db.engine.begin() as connection:
+        connection.execute(db.delete(User).where(User.id == admin.id))
+
+    response = client.get('/animals/create')
+    assert response.status_code == 302
+    assert response.headers['Location'].startswith('/auth/login')
+    with client.session_transaction() as session:
+        assert '_user_id' not in session
@@ -0,0 +1,64 @@
+import hashlib
+import os
+import uuid
+
+from flask import current_app
+
+from app.models import db, Blob, Image, ImageState
+from app.repositories.animal_repository import AnimalRepository
+from app.repositories.blob_repository import BlobRepository
+from app.unit_of_work import on_commit
+
+CONTENT = b'same picture'
+BLOB_HASH = hashlib.sha256(CONTENT).hexdigest()
+
+def write_tmp(data=CONTENT):
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], '.test-' + uuid.uuid4().hex)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as out:
+        out.write(data)
+    return path
+
+def add_image(animal_id):
+    """Изображение животного с содержимым CONTENT, как после process_image"""
+    repository = BlobRepository(db)
+    repository.acquire(write_tmp(), BLOB_HASH, len(CONTENT), 'image/png')
+    db.session.add(Image(id=str(uuid.uuid4()), file_name='x.png', mime_type='image/png',
+                         animal_id=animal_id, blob_hash=BLOB_HASH,
+                         processing_state=ImageState.READY))
+    db.session.commit()
+
+def test_delete_keeps_file_acquired_after_commit(app, animal):
+    add_image(animal.id)
+    other = AnimalRepository(db).create_animal(
+        name='Мурка', description='', age_months=3, breed='Дворовая',
+        gender='female', status=animal.status
+    )
+    db.session.commit()
+    other_id = other.id
+    blob_path = BlobRepository(db).file_path(BLOB_HASH)
+
+    def acquire_in_parallel_request():
+        # Между commit() удаления и очисткой файлов другой запрос загружает
+        # то же содержимое
+        with app.app_context():
+            add_image(other_id)
+
+    # Хук регистрируется раньше, чем очистка из delete_animal
+    on_commit(db.session, acquire_in_parallel_request)
+    AnimalRepository(db).delete_animal(animal.id)
+    db.session.commit()
+
+    blob = db.session.get(Blob, BLOB_HASH)
+    assert blob is not None and blob.refcount == 1
+    assert os.path.exists(blob_path)
+
+def test_delete_removes_unreferenced_file(app, animal):
+    add_image(animal.id)
+    blob_path = BlobRepository(db).file_path(BLOB_HASH)
+
+    AnimalRepository(db).delete_animal(animal.id)
+    db.session.commit()
+
+    assert db.session.get(Blob, BLOB_HASH) is None
+    assert not os.path.exists(blob_path)
@@ -0,0 +1,101 @@
+import io
+import os
+import uuid
+
+from flask_migrate import downgrade, upgrade
+from PIL import Image as PILImage
+
+from app.models import db, Animal, Image, ImageState
+from app.repositories.animal_repository import AnimalRepository
+from app.repositories.image_repository import ImageRepository, image_info_cache
+
+from conftest import MIGRATIONS_DIR, login_as
+
+HTML = b'<html><script>alert(document.cookie)</script></html>'
+
+def png_bytes():
+    out = io.BytesIO()
+    PILImage.new('RGB', (4, 4), 'red').save(out, format='PNG')
+    return out.getvalue()
+
+def upload(client, data, filename, content_type):
+    """Добавить животное с одним изображением через форму"""
+    return client.post('/animals/create', data={
+        'name': 'Барсик',
+        'description': 'Ласковый кот',
+        'age_months': 12,
+        'breed': 'Дворовый',
+        'gender': 'male',
+        'images': (io.BytesIO(data), filename, content_type),
+    }, content_type='multipart/form-data')
+
+def process_all():
+    repository = ImageRepository(db)
+    for image_id in repository.get_pending_image_ids():
+        try:
+            repository.process_image(image_id)
+        except ValueError:
+            pass
+    image_info_cache.clear()
+
+def test_declared_type_is_not_served(client, admin):
+    login_as(client, admin)
+    upload(client, png_bytes(), 'x.jpg', 'text/html')
+    process_all()
+
+    image = db.session.execute(db.select(Image)).scalar_one()
+    assert image.mime_type == 'image/png'
+    response = client.get(f'/images/{image.id}')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.headers['X-Content-Type-Options'] == 'nosniff'
+
+def test_html_disguised_as_image_is_not_served(client, admin):
+    login_as(client, admin)
+    upload(client, HTML, 'x.jpg', 'text/html')
+    process_all()
+
+    image = db.session.execute(db.select(Image)).scalar_one()
+    assert image.processing_state == ImageState.FAILED
+    response = client.get(f'/images/{image.id}')
+    assert response.status_code == 404
+    assert b'<script>' not in response.data
+
+def test_stored_untrusted_type_is_served_as_octet_stream(client, app, animal):
+    # Запись, сохранённая до проверки типа по содержимому
+    image = Image(id=str(uuid.uuid4()), file_name='x.jpg', mime_type='text/html',
+                  md5_hash='legacy', animal_id=animal.id, processing_state=ImageState.READY)
+    db.session.add(image)
+    db.session.commit()
+    path = f"{app.config['UPLOAD_FOLDER']}/{image.storage_filename}"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as out:
+        out.write(HTML)
+
+    response = client.get(f'/images/{image.id}')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/octet-stream'
+
+def test_created_at_backfill_keeps_upload_order(app, animal):
+    downgrade(directory=MIGRATIONS_DIR, revision='f5c2a8d413e7')
+    # id и время blob идут в обратном порядке загрузки: обложкой должно
+    # остаться первое загруженное фото
+    uploads = [('c-first', 'hash-a', '2024-01-03 00:00:00'),
+               ('b-second', 'hash-b', '2024-01-02 00:00:00'),
+               ('a-third', 'hash-c', '2024-01-01 00:00:00')]
+    with db.engine.begin() as connection:
+        for image_id, blob_hash, blob_created_at in uploads:
+            connection.execute(db.text(
+                "INSERT INTO blobs (hash, size, mime_type, refcount, created_at) "
+                "VALUES (:hash, 1, 'image/png', 1, :created_at)"
+            ), {'hash': blob_hash, 'created_at': blob_created_at})
+            connection.execute(db.text(
+                "INSERT INTO images (id, file_name, mime_type, animal_id, blob_hash, processing_state) "
+                "VALUES (:id, 'photo.png', 'image/png', :animal_id, :hash, 'READY')"
+            ), {'id': image_id, 'animal_id': animal.id, 'hash': blob_hash})
+    upgrade(directory=MIGRATIONS_DIR)
+    db.session.expire_all()
+
+    card = AnimalRepository(db)._listing_query().filter(Animal.id == animal.id).one()
+    assert card.cover_image_id == 'c-first'
+    assert [image.id for image in db.session.get(Animal, animal.id).images] == ['c-first', 'b-second', 'a-third']
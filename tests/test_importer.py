@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from app import importer
+from app.models import db, Animal, ImportProgress
+
+def write_records(path, count):
+    with open(path, 'w', encoding='utf-8') as out:
+        for number in range(count):
+            out.write(json.dumps({
+                'name': f'Животное {number}',
+                'description': 'Описание',
+                'age_months': 6,
+                'breed': 'Дворовая',
+                'gender': 'female',
+            }, ensure_ascii=False) + '\n')
+
+def animal_count():
+    return db.session.execute(db.select(db.func.count(Animal.id))).scalar()
+
+def test_resume_after_crash_following_commit(app, tmp_path, monkeypatch):
+    source = tmp_path / 'animals.jsonl'
+    write_records(source, 10)
+    import_chunk = importer._import_chunk
+
+    def crash_after_first_commit(*args):
+        import_chunk(*args)
+        raise SystemExit('killed')
+
+    monkeypatch.setattr(importer, '_import_chunk', crash_after_first_commit)
+    with pytest.raises(SystemExit):
+        importer.import_animals(str(source), chunk_size=4, workers=0)
+    assert animal_count() == 4
+
+    monkeypatch.setattr(importer, '_import_chunk', import_chunk)
+    totals = importer.import_animals(str(source), chunk_size=4, workers=0)
+
+    assert totals['animals'] == 6
+    assert animal_count() == 10
+    assert db.session.execute(db.select(ImportProgress)).first() is None
+    assert not (tmp_path / 'animals.jsonl.import-state.json').exists()
+
+def test_restart_imports_from_first_record(app, tmp_path):
+    source = tmp_path / 'animals.jsonl'
+    write_records(source, 3)
+    importer.import_animals(str(source), workers=0)
+    importer.import_animals(str(source), workers=0, restart=True)
+    assert animal_count() == 6
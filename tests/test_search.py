@@ -0,0 +1,37 @@
+from sqlalchemy import event
+
+from app import create_app
+from app.models import db, AnimalStatus
+from app.repositories.animal_repository import AnimalRepository
+
+def add_animal(name, description):
+    AnimalRepository(db).create_animal(name=name, description=description, age_months=3,
+                                       breed='Дворовая', gender='female',
+                                       status=AnimalStatus.AVAILABLE)
+    db.session.commit()
+
+def test_indexing_and_search_run_no_ddl(app, client):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        add_animal('Барсик', 'Ласковый кот')
+        response = client.get('/animals/search?q=Ласковый')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert response.status_code == 200
+    assert 'Барсик' in response.get_data(as_text=True)
+    assert not [statement for statement in statements if statement.lstrip().upper().startswith('CREATE')]
+
+def test_create_all_creates_fts_table():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+    with app.app_context():
+        db.create_all()
+        add_animal('Мурка', 'Игривая')
+
+        response = app.test_client().get('/animals/search?q=Игривая')
+        assert 'Мурка' in response.get_data(as_text=True)
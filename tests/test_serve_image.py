@@ -0,0 +1,47 @@
+import hashlib
+import io
+import os
+import uuid
+
+from PIL import Image as PILImage
+
+from app.models import db, Image, ImageState
+from app.repositories.blob_repository import BlobRepository
+from app.repositories.image_repository import image_info_cache
+
+def add_ready_image(app, animal):
+    out = io.BytesIO()
+    PILImage.new('RGB', (8, 8), 'blue').save(out, format='PNG')
+    data = out.getvalue()
+    blob_hash = hashlib.sha256(data).hexdigest()
+    tmp_path = f"{app.config['UPLOAD_FOLDER']}/.test-{uuid.uuid4().hex}"
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    with open(tmp_path, 'wb') as tmp:
+        tmp.write(data)
+    BlobRepository(db).acquire(tmp_path, blob_hash, len(data), 'image/png')
+    image = Image(id=str(uuid.uuid4()), file_name='x.png', mime_type='image/png',
+                  animal_id=animal.id, blob_hash=blob_hash, processing_state=ImageState.READY)
+    db.session.add(image)
+    db.session.commit()
+    image_info_cache.clear()
+    return image
+
+def test_etag_is_content_hash(app, client, animal):
+    image = add_ready_image(app, animal)
+    response = client.get(f'/images/{image.id}')
+    assert response.get_etag()[0] == image.blob_hash
+
+    thumb = client.get(f'/images/{image.id}?size=thumb')
+    assert thumb.get_etag()[0] == image.blob_hash + '.thumb'
+
+def test_not_modified_only_for_matching_etag(app, client, animal):
+    image = add_ready_image(app, animal)
+    etag = client.get(f'/images/{image.id}?size=thumb').headers['ETag']
+
+    assert client.get(f'/images/{image.id}?size=thumb', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get(f'/images/{image.id}?size=medium', headers={'If-None-Match': etag}).status_code == 200
+    assert client.get(f'/images/{image.id}', headers={'If-None-Match': '"x"'}).status_code == 200
+
+def test_unknown_image_is_never_not_modified(client):
+    response = client.get('/images/nonexistent', headers={'If-None-Match': '"nonexistent"'})
+    assert response.status_code == 404